@@ -1,11 +1,16 @@
 import os
 import json
+import atexit
 import time
+import itertools
+import importlib.util
 import threading
 import logging
+import unicodedata
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from telegram.ext import (
     Application,
@@ -15,11 +20,17 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Update
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton, InputFile, Update
 import asyncio
+import csv
+import io
 import re
 import json as _json
-from db import init_db, ensure_chat, get_currency, ensure_user as db_ensure_user, add_virtual_user as db_add_virtual_user, get_next_expense_id, insert_expense, list_expenses as db_list_expenses, count_expenses as db_count_expenses, list_users as db_list_users, compute_balances as db_compute_balances, list_settlements as db_list_settlements, export_expenses as db_export_expenses, set_chat_currency, get_chat, category_totals
+from db import init_db, ensure_chat, ensure_user as db_ensure_user, add_virtual_user as db_add_virtual_user, insert_expense, list_expenses_page as db_list_expenses_page, count_expenses as db_count_expenses, compute_balances as db_compute_balances, list_settlements as db_list_settlements, export_expenses as db_export_expenses, set_chat_currency, get_chat, category_totals, load_chat_state as db_load_chat_state, save_chat_settings as db_save_chat_settings, import_chat_json as db_import_chat_json, reset_chat as db_reset_chat
+
+import requests
+from requests.adapters import HTTPAdapter
+from cachetools import LRUCache, TTLCache
 
 try:
     import yfinance as yf  # type: ignore
@@ -31,6 +42,27 @@ try:
 except ImportError:
     genai = None
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ahocorasick  # type: ignore
+except ImportError:  # pragma: no cover
+    ahocorasick = None
+
+try:
+    import uvloop  # type: ignore
+except ImportError:  # pragma: no cover  (e.g. Windows)
+    uvloop = None
+
+# AIORateLimiter is only usable when its optional aiolimiter backend is installed
+if importlib.util.find_spec("aiolimiter") is not None:
+    from telegram.ext import AIORateLimiter
+else:  # pragma: no cover
+    AIORateLimiter = None
+
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
@@ -40,6 +72,10 @@ logging.basicConfig(
     level=LOG_LEVEL,
     format="%(asctime)s %(levelname)s %(name)s: %(message)s",
 )
+# The format above never shows process/thread info, so don't collect it for every record
+logging.logProcesses = False
+logging.logThreads = False
+logging.logMultiprocessing = False
 log = logging.getLogger("splitbot")
 log_currency = logging.getLogger("splitbot.currency")
 log_ai = logging.getLogger("splitbot.ai")
@@ -54,6 +90,7 @@ GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
 AI_PROVIDER = (os.getenv("AI_PROVIDER") or ("GEMINI" if GEMINI_API_KEY else "" )).upper().strip()
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:8b").strip()
+AI_TIMEOUT_S = float(os.getenv("AI_TIMEOUT_S", "4"))  # give up on the provider and use the regex parser after this
 
 # Unconditionally rewrite localhost/127.* when using OLLAMA to improve container ↔ host connectivity.
 if AI_PROVIDER == "OLLAMA" and ("localhost" in OLLAMA_BASE_URL or "127.0.0.1" in OLLAMA_BASE_URL):
@@ -63,9 +100,11 @@ if AI_PROVIDER == "OLLAMA" and ("localhost" in OLLAMA_BASE_URL or "127.0.0.1" in
 
 AI_ENABLED = False
 AI_PROVIDER_ACTIVE = None  # 'GEMINI' or 'OLLAMA' or None
+_GEMINI_MODEL = None  # shared GenerativeModel, built once when Gemini is configured
 if AI_PROVIDER == "GEMINI" and GEMINI_API_KEY and genai is not None:
     try:
         genai.configure(api_key=GEMINI_API_KEY)
+        _GEMINI_MODEL = genai.GenerativeModel(GEMINI_MODEL)
         AI_ENABLED = True
         AI_PROVIDER_ACTIVE = "GEMINI"
     except Exception as e:  # pragma: no cover
@@ -77,17 +116,24 @@ else:
     AI_ENABLED = False
     AI_PROVIDER_ACTIVE = None
 
+# Shared keep-alive HTTP session for Ollama (avoids a TCP handshake per probe / parse)
+_OLLAMA_SESSION = requests.Session()
+_OLLAMA_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0))
+_OLLAMA_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0))
+_OLLAMA_SESSION.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+
 # Simple health check cache for Ollama provider
 _AI_HEALTH_LAST_CHECK = 0.0
 _AI_HEALTH_OK = False
 _AI_HEALTH_TTL = 300  # seconds
+_AI_HEALTH_REFRESH = 15  # seconds between background probes while the bot runs
 _AI_LAST_ERROR: Optional[str] = None
 
 def _check_ollama_health(force: bool = False) -> bool:
     """Return True if current AI provider is healthy (or not Ollama).
     For Ollama: GET /api/tags (lightweight) every _AI_HEALTH_TTL seconds.
     """
-    global _AI_HEALTH_LAST_CHECK, _AI_HEALTH_OK
+    global _AI_HEALTH_LAST_CHECK, _AI_HEALTH_OK, _AI_LAST_ERROR
     if AI_PROVIDER_ACTIVE != "OLLAMA":
         return AI_ENABLED and bool(AI_PROVIDER_ACTIVE)
     now = time.time()
@@ -96,17 +142,12 @@ def _check_ollama_health(force: bool = False) -> bool:
     _AI_HEALTH_LAST_CHECK = now
     global OLLAMA_BASE_URL
     try:
-        import http.client
-        from urllib.parse import urlparse
         def _probe(base: str) -> Tuple[bool, Optional[str]]:
             try:
-                u = urlparse(base)
-                conn = http.client.HTTPConnection(u.hostname, u.port or (80 if u.scheme == 'http' else 443), timeout=5)
-                conn.request("GET", "/api/tags")
-                resp = conn.getresponse()
-                if resp.status == 200:
+                resp = _OLLAMA_SESSION.get(f"{base}/api/tags", timeout=5)
+                if resp.status_code == 200:
                     return True, None
-                return False, f"HTTP {resp.status}"
+                return False, f"HTTP {resp.status_code}"
             except Exception as ex:  # pragma: no cover
                 return False, f"{type(ex).__name__}: {ex}"
         ok, err = _probe(OLLAMA_BASE_URL)
@@ -141,6 +182,22 @@ def _check_ollama_health(force: bool = False) -> bool:
         _AI_HEALTH_OK = False
         return False
 
+
+async def _check_ollama_health_async(force: bool = False) -> bool:
+    """Async variant for handlers: serves the cached result, and runs an expired probe in a worker thread."""
+    if AI_PROVIDER_ACTIVE != "OLLAMA":
+        return AI_ENABLED and bool(AI_PROVIDER_ACTIVE)
+    if not force and (time.time() - _AI_HEALTH_LAST_CHECK) < _AI_HEALTH_TTL:
+        return _AI_HEALTH_OK
+    return await asyncio.to_thread(_check_ollama_health, force)
+
+
+async def _ollama_health_loop():
+    """Re-probe Ollama in a worker thread so handlers always hit a fresh cached result."""
+    while True:
+        await asyncio.to_thread(_check_ollama_health, True)
+        await asyncio.sleep(_AI_HEALTH_REFRESH)
+
 # Categories & emojis
 CATEGORIES = [
     "food", "groceries", "transport", "entertainment", "travel", "utilities", "health", "rent", "other"
@@ -156,6 +213,9 @@ CATEGORY_EMOJI = {
     "rent": "🏠",
     "other": "📦",
 }
+# "<emoji> " per category for message prefixes (an unknown category gets just the space, as before)
+CATEGORY_PREFIX = {c: f"{e} " for c, e in CATEGORY_EMOJI.items()}
+_CATEGORIES_DISPLAY = ", ".join(CATEGORY_PREFIX.get(c, " ") + c for c in CATEGORIES)
 CATEGORY_SYNONYMS = {
     "meal": "food",
     "dinner": "food",
@@ -173,16 +233,12 @@ CATEGORY_SYNONYMS = {
 }
 
 INLINE_CURRENCIES = ["ILS", "USD", "EUR", "GBP", "JPY", "CHF", "CAD"]
-_notified_limited_mode = set()
-PENDING_EXPENSES: Dict[int, Dict[str, Any]] = {}
-PENDING_NAMES: Dict[int, int] = {}  # chat_id -> user_id awaiting name text
+# Per-chat transient state expires so abandoned previews / name prompts don't accumulate
+_notified_limited_mode: "TTLCache[int, bool]" = TTLCache(maxsize=10_000, ttl=3600)
+PENDING_EXPENSES: "TTLCache[int, Dict[str, Any]]" = TTLCache(maxsize=10_000, ttl=3600)
+PENDING_NAMES: "TTLCache[int, int]" = TTLCache(maxsize=10_000, ttl=900)  # chat_id -> user_id awaiting name text
 PAGE_SIZE = 10
 
-# Hebrew localization flag (always true for now)
-# Hebrew localization flag (legacy global, now overridden per chat via /lang)
-HE_IL = True  # will be updated dynamically when /lang used
-
-"# Translation dictionary (basic static mapping)"
 T = {
     "start": "👋 היי! אני הבוט לפיצול הוצאות. כתוב /help כדי לראות פקודות.",
     "help": (
@@ -219,7 +275,7 @@ T = {
     "expense_recorded": "נרשמה הוצאה #{id} {amt:.2f} {cur} חולק בין {n} משתתפים.",
     "expense_recorded_conv": "נרשמה הוצאה #{id} {amt:.2f} {cur} (הומר מ-{oamt:.2f} {ocur} בשער {rate:.4f}) חולקה בין {n} משתתפים.",
     "auto_added": "נוספה הוצאה אוטומטית #{id} {amt:.2f} {cur} [{cat}] - {desc}",
-    "auto_added_conv": "נוספה הוצאה אוטומטית #{id} {amt:.2f} {cur} (מ-{oamt:.2f} {ocur} בשער {rate:.4f}) [{cat}] - {desc}",
+    "auto_added_conv": "נוספה הוצאה אוטומטית #{id} {amt:.2f}{approx} {cur} (מ-{oamt:.2f} {ocur} בשער {rate:.4f}) [{cat}] - {desc}",
     "no_expenses": "אין הוצאות עדיין.",
     "expenses_header": "🧾 הוצאות (15 אחרונות) [{cur}]:",
     "balances_zero": "הכל סגור: המאזנים אפס.",
@@ -236,6 +292,8 @@ T = {
     "pending_saved": "✅ נשמרה הוצאה #{id}.",
     "pending_canceled": "בוטל.",
     "approx_rate": "(שער משוער)",
+    "preview_src_approx": " (מקור: {oamt:.2f} {ocur} {approx_rate})",
+    "preview_src_noconv": " (מקור: {oamt:.2f} {ocur} ללא המרה)",
     "adduser_usage": "שימוש: /adduser <שם>",
     "user_exists": "המשתתף כבר קיים.",
     "user_added": "נוסף משתתף: {name}",
@@ -248,92 +306,293 @@ T = {
     "prompt_adduser": "👥 אין משתתפים עדיין. השתמשו ב-/adduser כדי להוסיף את שמכם.",
     "ask_name": "✍️ מה השם שנציג עבורך? שלח הודעה אחת עם השם.",
     "name_saved": "✅ השם נשמר: {name}",
+    "ollama_down": "שרת Ollama לא זמין – מעבר לניתוח בסיסי.",
+    "thinking": "🤖 חושב...",
+    "approve": "\nמאשר?",
+    "btn_yes": "✅ אישור",
+    "btn_cancel": "❌ ביטול",
+    "virtual": "(וירטואלי)",
+    "stats_header": "📊 קטגוריות:",
+    "categories_header": "קטגוריות:",
+    "lang_switched": "✅ השפה הוחלפה לעברית.",
+    "ai_off": "AI כבוי: שימוש במנתח בסיסי.",
+    "help_ai_gemini": "\n🤖 מצב AI: Gemini פעיל.",
+    "help_ai_ollama": "\n🤖 מצב AI: Ollama ({model}) {status}",
+    "help_ai_off": "\n🤖 מצב AI: כבוי (Regex בלבד).",
+    "help_ollama_up": "פעיל",
+    "help_ollama_down": "לא זמין – מעבר לניתוח בסיסי",
+    "ai_status_gemini": "ספק AI: Gemini\nמודל: {model}\nמצב: פעיל",
+    "ai_status_ollama": "ספק AI: Ollama\nמודל: {model}\nכתובת: {base}\nמצב: {status}",
+    "ai_status_error": "\nשגיאה: {error}",
+    "ai_up": "פעיל",
+    "ai_down": "לא זמין",
+    # /list rows (format_map over a per-expense view)
+    "row_conv": "{emoji} #{id} {payer} שילם {amt:.2f}{approx} {cur} (מ-{oamt:.2f} {ocur} @ {rate:.4f}) [{cat}] - {desc}",
+    "row_orig": "{emoji} #{id} {payer} שילם {amt:.2f}{approx} {cur} (מ-{oamt:.2f} {ocur}) [{cat}] - {desc}",
+    "row_plain": "{emoji} #{id} {payer} שילם {amt:.2f} {cur} [{cat}] - {desc}",
+}
+
+# English strings, same keys as T
+T_EN = {
+    "start": "👋 Hi! I'm the expense split bot. Type /help to see commands.",
+    "choose_currency": "Current currency: {cur}. Choose new (disabled after first expense):",
+    "usage_setcurrency": "Usage: /setcurrency <ISO3>",
+    "bad_currency": "Currency must be a 3-letter ISO code.",
+    "currency_locked": "Cannot change currency after expenses exist (still {cur}).",
+    "currency_already": "Currency already set to {cur}.",
+    "currency_changed": "Default currency changed: {old} -> {new}.",
+    "current_currency": "Current currency: {cur}",
+    "add_usage": "Usage: /add <amount> [ISO3] <description>",
+    "amount_positive": "Amount must be positive.",
+    "expense_recorded": "Recorded expense #{id} {amt:.2f} {cur} split among {n} participants.",
+    "expense_recorded_conv": "Recorded expense #{id} {amt:.2f} {cur} (from {oamt:.2f} {ocur} @ {rate:.4f}) split among {n} participants.",
+    "auto_added": "Auto-added expense #{id} {amt:.2f} {cur} [{cat}] - {desc}",
+    "auto_added_conv": "Auto-added expense #{id} {amt:.2f}{approx} {cur} (from {oamt:.2f} {ocur} @ {rate:.4f}) [{cat}] - {desc}",
+    "no_expenses": "No expenses yet.",
+    "expenses_header": "Expenses [{cur}]:",
+    "balances_zero": "All settled: balances are zero.",
+    "balances_zero_one": "All settled (only one participant).",
+    "balances_header": "Balances [{cur}]:",
+    "settle_none": "Nothing to settle.",
+    "settle_header": "Suggested payments [{cur}]:",
+    "ai_disabled": "AI parsing disabled. Using basic parser.",
+    "amount_not_found": "Couldn't detect an amount.",
+    "pending_missing": "No pending expense.",
+    "pending_saved": "Saved expense #{id}",
+    "pending_canceled": "Canceled.",
+    "approx_rate": "(approximate rate)",
+    "preview_src_approx": " (source: {oamt:.2f} {ocur} {approx_rate})",
+    "preview_src_noconv": " (source: {oamt:.2f} {ocur}, not converted)",
+    "user_exists": "User already exists.",
+    "user_added": "Added user: {name}",
+    "users_header": "Participants:",
+    "no_other_users": "No participants yet.",
+    "reset_inline_warn": "Warning: This will erase all data. Continue?",
+    "reset_inline_done": "Reset complete. Use /adduser to add participants.",
+    "reset_inline_canceled": "Reset canceled.",
+    "prompt_adduser": "No participants yet. Use /adduser to add your name.",
+    "ask_name": "Send your display name in one message.",
+    "name_saved": "Saved name: {name}",
+    "ollama_down": "Ollama unreachable – falling back to basic parser.",
+    "thinking": "🤖 Thinking...",
+    "approve": "\nApprove?",
+    "btn_yes": "✅ Yes",
+    "btn_cancel": "❌ Cancel",
+    "virtual": "(virtual)",
+    "stats_header": "Category totals:",
+    "categories_header": "Categories:",
+    "lang_switched": "✅ Language switched to English.",
+    "ai_off": "AI disabled: using regex parser.",
+    "help": (
+        "📘 Commands:\n"
+        "ℹ️ /help - this help.\n"
+        "🚀 /start - welcome message.\n"
+        "💱 /setcurrency [ISO3] - set base currency before first expense.\n"
+        "💰 /currency - show current currency.\n"
+        "➕ /add <amount> [ISO3] <description> - add expense.\n"
+        "🧑‍🤝‍🧑 /adduser [name] - add virtual participant or set your name.\n"
+        "👥 /users - list participants.\n"
+        "🧾 /list [page] - list expenses (pagination arrows).\n"
+        "⚖️ /bal - weighted balances.\n"
+        "🤝 /settle - settlement suggestions.\n"
+        "🏷️ /categories - list categories.\n"
+        "📊 /stats - category totals.\n"
+        "🤖 /ai - AI provider status.\n"
+        "📤 /export - export CSV.\n"
+        "🌐 /lang - toggle language (Hebrew/English).\n"
+        "♻️ /reset - wipe all data (confirmation).\n"
+        "✍️ Free text like '120 ils falafel' creates a pending expense for confirmation.\n"
+        "(Current currency: {currency})"
+    ),
+    "help_ai_gemini": "\n🤖 AI: Gemini model={model} (healthy)",
+    "help_ai_ollama": "\n🤖 AI: Ollama model={model} base={base} status={status}",
+    "help_ai_off": "\n🤖 AI: disabled (regex fallback).",
+    "help_ollama_up": "healthy",
+    "help_ollama_down": "unreachable",
+    "ai_status_gemini": "AI Provider: Gemini\nModel: {model}\nStatus: active",
+    "ai_status_ollama": "AI Provider: Ollama\nModel: {model}\nBase URL: {base}\nStatus: {status}",
+    "ai_status_error": "\nError: {error}",
+    "ai_up": "healthy",
+    "ai_down": "unreachable",
+    "row_conv": "{emoji} #{id} {payer} paid {amt:.2f}{approx} {cur} (from {oamt:.2f} {ocur} @ {rate:.4f}) [{cat}] - {desc}",
+    "row_orig": "{emoji} #{id} {payer} paid {amt:.2f}{approx} {cur} (from {oamt:.2f} {ocur}) [{cat}] - {desc}",
+    "row_plain": "{emoji} #{id} {payer} paid {amt:.2f} {cur} [{cat}] - {desc}",
+}
+# Indexed by the per-chat "is Hebrew" flag: MSG[he][key]
+MSG = {True: T, False: T_EN}
+
+# Free-text preview per language, keyed by (converted, foreign currency, fx fallback); a converted preview ignores the rest
+_PREVIEW_TEMPLATES: Dict[bool, Dict[Tuple[bool, bool, bool], str]] = {
+    he: {
+        **{(True, foreign, fb): m["auto_added_conv"] for foreign in (True, False) for fb in (True, False)},
+        (False, True, True): m["auto_added"] + m["preview_src_approx"],
+        (False, True, False): m["auto_added"] + m["preview_src_noconv"],
+        (False, False, True): m["auto_added"],
+        (False, False, False): m["auto_added"],
+    }
+    for he, m in MSG.items()
 }
 
 # Currency synonym / symbol detection (Hebrew + symbols)
 COMMON_CURRENCIES = [
     "USD","EUR","GBP","ILS","JPY","CHF","CAD","AUD","NZD","SEK","NOK","DKK","ZAR","PLN","TRY","MXN","BRL","INR","RUB","CNY","HKD","SGD","AED","SAR","EGP"
 ]
+_COMMON_CURRENCIES_SET = frozenset(COMMON_CURRENCIES)
 
 # Map lowercase tokens / symbols -> ISO
-"""Currency synonyms map.
-NOTE: We add multiple variants for Hebrew shekel forms including different quotes and punctuation.
-We intentionally keep shorter tokens like 'שח' but later when cleaning description we remove an
-isolated trailing currency word so it does not appear twice.
-"""
-CURRENCY_SYNONYMS = {
-    "₪": "ILS",
-    "שח": "ILS",        # common no-quote form
-    "ש״ח": "ILS",       # Hebrew double quote char U+05F4
-    "ש""ח": "ILS",      # ASCII quotes variant appears in source escaping
-    "ש""ח.": "ILS",
-    "ש""ח,": "ILS",
-    "ש""ח?": "ILS",
-    "ש""ח!": "ILS",
-    "ש""ח\n": "ILS",
-    "ש""ח\r": "ILS",
-    "שקל": "ILS",
-    "שקלים": "ILS",
-    "שקל חדש": "ILS",
-    "nis": "ILS",
-    "n.i.s": "ILS",
-    "ils": "ILS",
-    "usd$": "USD",  # improbable but just in case
-    "$": "USD",
-    "eur": "EUR",
-    "€": "EUR",
-    "£": "GBP",
-    "gbp": "GBP",
-    "aud": "AUD",
-    "cad": "CAD",
-    "fr": "CHF",  # sometimes mistakenly typed
-    "chf": "CHF",
-    "yen": "JPY",
-    "jpy": "JPY",
-    "inr": "INR",
-    "rs": "INR",
-    "₹": "INR",
-    "brl": "BRL",
-    "real": "BRL",
-    "mxn": "MXN",
-    "peso": "MXN",
-    "zar": "ZAR",
-    "rand": "ZAR",
-    "rub": "RUB",
-    "руб": "RUB",
-    "cny": "CNY",
-    "rmb": "CNY",
-    "元": "CNY",
-    "sgd": "SGD",
-    "hkd": "HKD",
-    "aed": "AED",
-    "درهم": "AED",
-    "sar": "SAR",
-    "ريال": "SAR",
-    "egp": "EGP",
+# Canonical (variant, iso) pairs; trailing punctuation is stripped before lookups so only bare forms are listed.
+# We intentionally keep shorter tokens like 'שח' but later when cleaning description we remove an
+# isolated trailing currency word so it does not appear twice.
+_CURRENCY_SYNONYM_PAIRS: List[Tuple[str, str]] = [
+    ("₪", "ILS"),
+    ("שח", "ILS"),  # common no-quote form
+    ("ש\u05F4ח", "ILS"),  # Hebrew gershayim U+05F4
+    ('ש"ח', "ILS"),  # ASCII double quote variant
+    ("שקל", "ILS"),
+    ("שקלים", "ILS"),
+    ("שקל חדש", "ILS"),
+    ("nis", "ILS"),
+    ("n.i.s", "ILS"),
+    ("ils", "ILS"),
+    ("usd$", "USD"),  # improbable but just in case
+    ("$", "USD"),
+    ("eur", "EUR"),
+    ("€", "EUR"),
+    ("£", "GBP"),
+    ("gbp", "GBP"),
+    ("aud", "AUD"),
+    ("cad", "CAD"),
+    ("fr", "CHF"),  # sometimes mistakenly typed
+    ("chf", "CHF"),
+    ("yen", "JPY"),
+    ("jpy", "JPY"),
+    ("inr", "INR"),
+    ("rs", "INR"),
+    ("₹", "INR"),
+    ("brl", "BRL"),
+    ("real", "BRL"),
+    ("mxn", "MXN"),
+    ("peso", "MXN"),
+    ("zar", "ZAR"),
+    ("rand", "ZAR"),
+    ("rub", "RUB"),
+    ("руб", "RUB"),
+    ("cny", "CNY"),
+    ("rmb", "CNY"),
+    ("元", "CNY"),
+    ("sgd", "SGD"),
+    ("hkd", "HKD"),
+    ("aed", "AED"),
+    ("درهم", "AED"),
+    ("sar", "SAR"),
+    ("ريال", "SAR"),
+    ("egp", "EGP"),
     # Hebrew plain words
-    "דולר": "USD",
-    "דולרים": "USD",
-    "דולר אמריקאי": "USD",
-    "יורו": "EUR",
-    "אירו": "EUR",
-    "פאונד": "GBP",
-    "לירה": "GBP",
-    "לירה שטרלינג": "GBP",
-    "רופי": "INR",
-    "רופי הודי": "INR",
-    "פסו": "MXN",
-    "ריאל": "BRL",
-    "יואן": "CNY",
-    "דירהם": "AED",
-    "ריאל סעודי": "SAR",
-    "לירה טורקית": "TRY",
-    "שקל": "ILS",
-    "שקל חדש": "ILS",
-}
+    ("דולר", "USD"),
+    ("דולרים", "USD"),
+    ("דולר אמריקאי", "USD"),
+    ("יורו", "EUR"),
+    ("אירו", "EUR"),
+    ("פאונד", "GBP"),
+    ("לירה", "GBP"),
+    ("לירה שטרלינג", "GBP"),
+    ("רופי", "INR"),
+    ("רופי הודי", "INR"),
+    ("פסו", "MXN"),
+    ("ריאל", "BRL"),
+    ("יואן", "CNY"),
+    ("דירהם", "AED"),
+    ("ריאל סעודי", "SAR"),
+    ("לירה טורקית", "TRY"),
+]
+CURRENCY_SYNONYMS: Dict[str, str] = {unicodedata.normalize("NFC", k): v for k, v in _CURRENCY_SYNONYM_PAIRS}
+assert len(CURRENCY_SYNONYMS) == len(_CURRENCY_SYNONYM_PAIRS), "duplicate currency synonym"
+# Any lowercase word that names a currency (ISO codes + synonyms), for stripping trailing tokens
+_CURRENCY_WORDS = frozenset(c.lower() for c in COMMON_CURRENCIES) | frozenset(CURRENCY_SYNONYMS)
+# Short connectors left dangling once a trailing currency word is removed ('ב' = for/at)
+_CONNECTORS = frozenset({"ב", "על", "עם", "for", "at", "on", "to"})
+
+# Amount adjacent to a 3-letter code, e.g. 120usd, usd120, 120 usd, usd 120
+_NUM_CODE_RE = re.compile(r"(?:(\d+[\.,]?\d*)\s*([a-z]{3}))|(([a-z]{3})\s*(\d+[\.,]?\d*))")
+_DIGIT_SHEKEL_RE = re.compile(r"\d+\s*₪")
+# Standalone ISO3 words; COMMON_CURRENCIES order decides between several matches
+_ISO_WORD_RE = re.compile(r"\b(" + "|".join(c.lower() for c in COMMON_CURRENCIES) + r")\b")
+_ISO_PRIORITY = {c.lower(): i for i, c in enumerate(COMMON_CURRENCIES)}
+_SYNONYM_KEYS_SORTED = sorted(CURRENCY_SYNONYMS, key=len, reverse=True)
+
+
+def _build_synonym_automaton():
+    """Build an Aho-Corasick automaton over CURRENCY_SYNONYMS (None if pyahocorasick missing).
+    Each key stores (rank, iso) where rank follows longest-first order so the lowest rank wins.
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for rank, key in enumerate(_SYNONYM_KEYS_SORTED):
+        if key:
+            automaton.add_word(key, (rank, key, CURRENCY_SYNONYMS[key]))
+    automaton.make_automaton()
+    return automaton
+
 
-FX_CACHE: Dict[str, Tuple[float, float]] = {}  # pair -> (rate, timestamp_epoch)
+_SYNONYM_AUTOMATON = _build_synonym_automaton()
+
+FX_CACHE: Dict[str, Tuple[Optional[float], float, bool]] = {}  # pair -> (rate or None for a failed lookup, timestamp_epoch, fallback_used)
 FX_TTL_SECONDS = 60 * 60 * 6  # 6 hours
+FX_NEGATIVE_TTL_SECONDS = 300  # retry window after every strategy failed
+FX_CACHE_FILE = DATA_DIR / "fx_cache.json"
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+
+# Keep-alive session for Yahoo chart quotes (tiny JSON instead of a yfinance DataFrame per pair)
+_FX_SESSION = requests.Session()
+_FX_SESSION.mount("https://", HTTPAdapter(pool_maxsize=5))
+_FX_SESSION.headers.update({"User-Agent": "Mozilla/5.0 (SplitBot)"})
+# Live lookups run in worker threads; cap how many run at once and serialize cache-file writes
+_FX_SEM = asyncio.Semaphore(4)
+_FX_SAVE_LOCK = threading.Lock()
+
+
+def _load_fx_cache() -> None:
+    """Seed FX_CACHE from disk so restarts don't refetch fresh quotes."""
+    if not FX_CACHE_FILE.exists():
+        return
+    try:
+        if orjson is not None:
+            raw = orjson.loads(FX_CACHE_FILE.read_bytes())
+        else:
+            with FX_CACHE_FILE.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+        for pair, entry in raw.items():
+            if len(entry) > 2 and entry[2]:
+                continue  # fallback estimate from an older file; only real quotes survive a restart
+            FX_CACHE[pair] = (float(entry[0]), float(entry[1]), False)
+    except Exception as e:  # pragma: no cover
+        log_currency.warning("failed to load fx cache %s: %s", FX_CACHE_FILE, e)
+
+
+def _save_fx_cache() -> None:
+    """Persist live quotes only; bridged/static/stale fallbacks stay in memory so a restart drops them."""
+    try:
+        snapshot = {p: v for p, v in list(FX_CACHE.items()) if v[0] is not None and not v[2]}
+        if orjson is not None:
+            body = orjson.dumps(snapshot)
+        else:
+            body = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+        with _FX_SAVE_LOCK:
+            tmp = FX_CACHE_FILE.with_suffix(".tmp")
+            tmp.write_bytes(body)
+            tmp.replace(FX_CACHE_FILE)
+    except Exception as e:  # pragma: no cover
+        log_currency.warning("failed to save fx cache %s: %s", FX_CACHE_FILE, e)
+
+
+def _fx_store(pair: str, rate: float, now: float, fallback: bool = False) -> None:
+    FX_CACHE[pair] = (rate, now, fallback)
+    if not fallback:
+        _save_fx_cache()
+
+
+_load_fx_cache()
 
 # Static emergency fallback mid-market estimates (update occasionally)
 STATIC_FX_RATES = {
@@ -357,23 +616,50 @@ def get_fx_rate(from_cur: str, to_cur: str) -> Tuple[Optional[float], bool]:
       1. Direct quote (not fallback)
       2. Inverse quote (not fallback)
       3. Bridge via USD (fallback=True)
-      4. Static table (fallback=True)
-    Cached for FX_TTL_SECONDS.
+      4. Stale cached quote (fallback=True)
+      5. Static table (fallback=True)
+    Cached for FX_TTL_SECONDS (with its fallback flag). When every live strategy fails, an expired
+    quote is served as fallback before the static table; total failures are cached for FX_NEGATIVE_TTL_SECONDS.
     """
     if from_cur == to_cur:
         return 1.0, False
     pair = f"{from_cur}->{to_cur}"
     now = time.time()
-    if pair in FX_CACHE:
-        rate, ts = FX_CACHE[pair]
-        if now - ts < FX_TTL_SECONDS:
-            log_currency.debug("fx cache hit pair=%s rate=%s age=%.1fs", pair, rate, now - ts)
-            return rate, False  # cache retains original fallback semantics; simplification: treat cached as non-fallback
+    cached = FX_CACHE.get(pair)
+    stale: Optional[float] = None
+    if cached is not None:
+        rate, ts, fb = cached
+        if rate is None:
+            if now - ts < FX_NEGATIVE_TTL_SECONDS:
+                return None, True
+        elif now - ts < FX_TTL_SECONDS:
+            if log_currency.isEnabledFor(logging.DEBUG):
+                log_currency.debug("fx cache hit pair=%s rate=%s age=%.1fs", pair, rate, now - ts)
+            return rate, fb
+        else:
+            stale = rate
     # Helper to fetch a direct yahoo pair
     def _fetch_direct(a: str, b: str) -> Optional[float]:
+        symbol = fx_pair_symbol(a, b)
+        try:
+            resp = _FX_SESSION.get(YAHOO_CHART_URL.format(symbol=symbol), params={"interval": "1d", "range": "1d"}, timeout=5)
+            if resp.status_code == 200:
+                result = (resp.json().get("chart") or {}).get("result") or []
+                closes = []
+                if result:
+                    closes = [c for c in (result[0]["indicators"]["quote"][0].get("close") or []) if c]
+                if closes:
+                    r = float(closes[-1])
+                    log_currency.debug("fx chart fetch symbol=%s rate=%s", symbol, r)
+                    return r
+                log_currency.debug("fx empty chart symbol=%s", symbol)
+            else:
+                log_currency.debug("fx chart HTTP %s symbol=%s", resp.status_code, symbol)
+        except Exception as e:  # pragma: no cover
+            log_currency.debug("fx chart exception symbol=%s error=%s", symbol, e)
+        # Fallback: yfinance (heavier, builds a DataFrame)
         if yf is None:
             return None
-        symbol = fx_pair_symbol(a, b)
         try:
             ticker = yf.Ticker(symbol)
             hist = ticker.history(period="1d")
@@ -390,14 +676,14 @@ def get_fx_rate(from_cur: str, to_cur: str) -> Tuple[Optional[float], bool]:
     # Strategy 1: direct
     direct = _fetch_direct(from_cur, to_cur)
     if direct:
-        FX_CACHE[pair] = (direct, now)
+        _fx_store(pair, direct, now)
         return direct, False
     # Strategy 2: inverse
     inverse = _fetch_direct(to_cur, from_cur)
     if inverse:
         inv_rate = 1.0 / inverse if inverse else None
         if inv_rate:
-            FX_CACHE[pair] = (inv_rate, now)
+            _fx_store(pair, inv_rate, now)
             log_currency.debug("fx inverse used pair=%s base_rate=%s inv=%s", pair, inverse, inv_rate)
             return inv_rate, False
     # Strategy 3: bridge USD
@@ -406,19 +692,73 @@ def get_fx_rate(from_cur: str, to_cur: str) -> Tuple[Optional[float], bool]:
         b, b_fb = get_fx_rate("USD", to_cur)
         if a and b:
             bridged = round(a * b, 6)
-            FX_CACHE[pair] = (bridged, now)
+            _fx_store(pair, bridged, now, True)
             log_currency.debug("fx bridged via USD pair=%s rate=%s (a=%s b=%s)", pair, bridged, a, b)
             return bridged, True
-    # Strategy 4: static fallback
+    # Strategy 4: last known (expired) quote; re-stamped to expire again after FX_NEGATIVE_TTL_SECONDS
+    if stale is not None:
+        FX_CACHE[pair] = (stale, now - FX_TTL_SECONDS + FX_NEGATIVE_TTL_SECONDS, True)
+        log_currency.debug("fx stale quote served pair=%s rate=%s", pair, stale)
+        return stale, True
+    # Strategy 5: static fallback
     if pair in STATIC_FX_RATES:
         rate = STATIC_FX_RATES[pair]
-        FX_CACHE[pair] = (rate, now)
+        _fx_store(pair, rate, now, True)
         log_currency.debug("fx static fallback pair=%s rate=%s", pair, rate)
         return rate, True
     log_currency.debug("fx all strategies failed pair=%s", pair)
+    FX_CACHE[pair] = (None, now, True)
     return None, True
 
 
+async def get_fx_rate_async(from_cur: str, to_cur: str) -> Tuple[Optional[float], bool]:
+    """get_fx_rate for async handlers: fresh cache hits are answered inline, live lookups
+    (HTTP / yfinance) run in a worker thread so they never block the event loop."""
+    cached = FX_CACHE.get(f"{from_cur}->{to_cur}")
+    if from_cur == to_cur or (cached is not None and cached[0] is not None and time.time() - cached[1] < FX_TTL_SECONDS):
+        return get_fx_rate(from_cur, to_cur)
+    async with _FX_SEM:
+        return await asyncio.to_thread(get_fx_rate, from_cur, to_cur)
+
+
+def prefetch_fx(base: str, sources: List[str]) -> int:
+    """Warm FX_CACHE with SOURCE->base quotes in one yfinance download (pairs still fresh are skipped).
+    Returns the number of quotes stored; get_fx_rate keeps fetching per pair on any miss."""
+    if yf is None:
+        return 0
+    now = time.time()
+    wanted: Dict[str, str] = {}  # yahoo symbol -> cache pair
+    for cur in sources:
+        if cur == base:
+            continue
+        pair = f"{cur}->{base}"
+        cached = FX_CACHE.get(pair)
+        if cached is not None and cached[0] is not None and now - cached[1] < FX_TTL_SECONDS:
+            continue
+        wanted[fx_pair_symbol(cur, base)] = pair
+    if not wanted:
+        return 0
+    try:
+        frame = yf.download(tickers=list(wanted), period="1d", group_by="ticker", threads=True, progress=False)
+    except Exception as e:  # pragma: no cover
+        log_currency.debug("fx prefetch failed base=%s error=%s", base, e)
+        return 0
+    stored = 0
+    top_level = set(frame.columns.get_level_values(0))
+    for symbol, pair in wanted.items():
+        try:
+            closes = (frame[symbol] if symbol in top_level else frame)["Close"].dropna()
+        except Exception:  # pragma: no cover
+            continue
+        if not closes.empty:
+            FX_CACHE[pair] = (float(closes.iloc[-1]), now, False)
+            stored += 1
+    if stored:
+        _save_fx_cache()
+    log_currency.debug("fx prefetch base=%s stored=%d/%d", base, stored, len(wanted))
+    return stored
+
+
 def detect_currency_token(text: str) -> Optional[str]:
     """Attempt to detect a foreign currency token in free text.
 
@@ -430,320 +770,483 @@ def detect_currency_token(text: str) -> Optional[str]:
     Returns first match (normalized uppercase) or None.
     """
     if not text:
-        log_currency.debug("detect_currency_token: empty text")
         return None
-    lower = text.lower()
-    # Normalize Hebrew quotes variant for detection (convert U+05F4 to straight quotes pattern we keyed)
-    lower = lower.replace("ש״ח", "ש""ח")
+    debug = log_currency.isEnabledFor(logging.DEBUG)
+    lower = unicodedata.normalize("NFC", text.lower())
     # 1. number + code or code + number (allow punctuation) e.g. 120usd, usd120, 120 usd, usd 120
-    num_code_pattern = re.compile(r"(?:(\d+[\.,]?\d*)\s*([a-z]{3}))|(([a-z]{3})\s*(\d+[\.,]?\d*))")
-    for m in num_code_pattern.finditer(lower):
+    for m in _NUM_CODE_RE.finditer(lower):
         groups = [g for g in m.groups() if g]
         for g in groups:
             g2 = g.strip().lower()
             if len(g2) == 3 and g2.isalpha():
                 iso = g2.upper()
-                if iso in COMMON_CURRENCIES:
-                    log_currency.debug("pattern num+code match iso=%s text=%s", iso, text)
+                if iso in _COMMON_CURRENCIES_SET:
+                    if debug:
+                        log_currency.debug("pattern num+code match iso=%s text=%s", iso, text)
                     return iso
     # 2. digits immediately followed by ₪ (common user input like 30₪) before generic synonym scan
-    if re.search(r"\d+\s*₪", text):
-        log_currency.debug("digits+₪ immediate match text=%s", text)
+    if _DIGIT_SHEKEL_RE.search(text):
+        if debug:
+            log_currency.debug("digits+₪ immediate match text=%s", text)
         return "ILS"
     # 3. symbols / synonyms substring search (prefer longer keys first to avoid partial overshadow)
-    for key in sorted(CURRENCY_SYNONYMS.keys(), key=len, reverse=True):
-        iso = CURRENCY_SYNONYMS[key]
-        if key and key in lower:
-            log_currency.debug("symbol/synonym match key=%s iso=%s text=%s", key, iso, text)
+    if _SYNONYM_AUTOMATON is not None:
+        best = min((v for _, v in _SYNONYM_AUTOMATON.iter(lower)), default=None)
+        if best is not None:
+            _, key, iso = best
+            if debug:
+                log_currency.debug("symbol/synonym match key=%s iso=%s text=%s", key, iso, text)
             return iso
+    else:
+        for key in _SYNONYM_KEYS_SORTED:
+            iso = CURRENCY_SYNONYMS[key]
+            if key and key in lower:
+                if debug:
+                    log_currency.debug("symbol/synonym match key=%s iso=%s text=%s", key, iso, text)
+                return iso
     # 4. standalone ISO3 tokens
-    for iso in COMMON_CURRENCIES:
-        if re.search(rf"\b{iso.lower()}\b", lower):
+    words = _ISO_WORD_RE.findall(lower)
+    if words:
+        iso = min(words, key=_ISO_PRIORITY.__getitem__).upper()
+        if debug:
             log_currency.debug("standalone iso match iso=%s text=%s", iso, text)
-            return iso
+        return iso
     # 5. fallback: already handled digits+₪ above
-    log_currency.debug("no currency detected text=%s", text)
+    if debug:
+        log_currency.debug("no currency detected text=%s", text)
     return None
 
 
+# Write-behind chat cache: load_chat serves from memory, save_chat only marks the chat dirty
+# and a background task (plus atexit) flushes dirty chat settings to SQLite.
+# The cache is size-bounded; dirty chats are held in _DIRTY until flushed, so eviction loses nothing.
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "5000"))
+_CHAT_CACHE: "LRUCache[int, Dict[str, Any]]" = LRUCache(maxsize=CHAT_CACHE_SIZE)
+_DIRTY: Dict[int, Dict[str, Any]] = {}
+_FLUSH_EVENT = asyncio.Event()
+_FLUSH_COALESCE = 0.1  # seconds to wait after the first save so bursts share one write
+
+
+# Per-chat locks serialize read-modify-write of a cached chat dict across awaits.
+# Each entry counts its holder + waiters and is dropped when the last one leaves, so idle chats keep none.
+_CHAT_LOCKS: Dict[int, List[Any]] = {}  # chat_id -> [lock, users]
+
+
+@asynccontextmanager
+async def chat_lock(chat_id: int):
+    entry = _CHAT_LOCKS.get(chat_id)
+    if entry is None:
+        entry = _CHAT_LOCKS[chat_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _CHAT_LOCKS[chat_id]
+
+
+# Chats whose /list page is being rendered; arrow clicks arriving meanwhile are dropped.
+# Entries are removed when rendering ends, so the set only holds in-flight chats.
+_PAGE_BUSY: "set[int]" = set()
+
+# Rendered /list pages keyed by (chat_id, chat revision, callback data). A chat gets a new revision
+# when loaded and whenever its expenses, names or language change, so stale pages are never hit.
+_PAGE_CACHE: "LRUCache[Tuple[int, int, str], Tuple[str, Optional[InlineKeyboardMarkup]]]" = LRUCache(maxsize=256)
+_REVISIONS = itertools.count(1)
+
+
+def bump_revision(data: Dict[str, Any]) -> None:
+    data["_rev"] = next(_REVISIONS)
+
+
+def _cached_chat(chat_id: int) -> Optional[Dict[str, Any]]:
+    data = _CHAT_CACHE.get(chat_id)
+    if data is None:
+        data = _DIRTY.get(chat_id)  # evicted before its settings were flushed
+        if data is not None:
+            _CHAT_CACHE[chat_id] = data
+    return data
+
+
+def _read_chat_state(chat_id: int) -> Dict[str, Any]:
+    """Blocking part of a cache miss: legacy file import + one SQLite read."""
+    _import_legacy_chat_file(chat_id)
+    data = db_load_chat_state(chat_id, DEFAULT_CURRENCY)
+    data["_he"] = data["language"] == "he"  # underscore keys are in-memory only
+    bump_revision(data)
+    return data
+
+
 def load_chat(chat_id: int) -> Dict[str, Any]:
+    """Cached chat settings + participant names; SQLite is the source of truth."""
+    data = _cached_chat(chat_id)
+    if data is None:
+        data = _CHAT_CACHE[chat_id] = _read_chat_state(chat_id)
+    return data
+
+
+async def load_chat_async(chat_id: int) -> Dict[str, Any]:
+    """load_chat for handlers: a cache miss reads SQLite in a worker thread, not on the event loop."""
+    data = _cached_chat(chat_id)
+    if data is None:
+        fresh = await asyncio.to_thread(_read_chat_state, chat_id)
+        data = _cached_chat(chat_id)  # another update may have loaded it meanwhile
+        if data is None:
+            data = _CHAT_CACHE[chat_id] = fresh
+    return data
+
+
+def _reset_chat_state(chat_id: int) -> Dict[str, Any]:
+    data = db_reset_chat(chat_id, DEFAULT_CURRENCY)
+    data["_he"] = data["language"] == "he"
+    bump_revision(data)
+    return data
+
+
+async def reset_chat_data(chat_id: int) -> Dict[str, Any]:
+    """Wipe the chat in one transaction and cache its fresh default state (no reload afterwards)."""
+    fresh = await asyncio.to_thread(_reset_chat_state, chat_id)
+    evict_chat(chat_id)  # drops any pending settings flush for the old state
+    _CHAT_CACHE[chat_id] = fresh
+    return fresh
+
+
+async def load_chat_with(chat_id: int, fn, *args) -> Tuple[Dict[str, Any], Any]:
+    """load_chat_async plus a blocking db read; on a cache miss both run in worker threads concurrently."""
+    data = _cached_chat(chat_id)
+    if data is not None:
+        return data, await asyncio.to_thread(fn, *args)
+    data, result = await asyncio.gather(load_chat_async(chat_id), asyncio.to_thread(fn, *args))
+    return data, result
+
+
+def _import_legacy_chat_file(chat_id: int) -> None:
+    """Move a pre-SQLite data/<chat_id>.json (and its meta sidecar) into the DB once, then delete it."""
     fp = DATA_DIR / f"{chat_id}.json"
     if not fp.exists():
-        return {
-            "chat_id": chat_id,
-            "currency": DEFAULT_CURRENCY,
-            "users": {},
-            "expenses": [],
-            "next_expense_id": 1,
-            "virtual_seq": -1,
-        }
-    with fp.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    # Backfill currency if missing from old file
-    if "currency" not in data:
-        data["currency"] = DEFAULT_CURRENCY
-    if "virtual_seq" not in data:
-        data["virtual_seq"] = -1
-    if "language" not in data:
-        data["language"] = "he"
-    return data
+        return
+    try:
+        if orjson is not None:
+            legacy = orjson.loads(fp.read_bytes())
+        else:
+            with fp.open("r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        db_import_chat_json(chat_id, legacy, DEFAULT_CURRENCY)
+    except Exception as e:  # pragma: no cover
+        log.warning("failed to import legacy chat file %s: %s", fp, e)
+        return
+    for old in (fp, DATA_DIR / f"{chat_id}.meta.json"):
+        old.unlink(missing_ok=True)
 
 
 def save_chat(data: Dict[str, Any]):
-    fp = DATA_DIR / f"{data['chat_id']}.json"
-    tmp = fp.with_suffix(".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    tmp.replace(fp)
-
-
-def compute_balances(data: Dict[str, Any]) -> Dict[str, float]:
-    balances: Dict[str, float] = {uid: 0.0 for uid in data["users"].keys()}
-    for exp in data["expenses"]:
-        participants = exp["participants"]
-        if not participants:
-            continue
-        share = exp["amount"] / len(participants)
-        payer = str(exp["payer"])
-        balances.setdefault(payer, 0.0)
-        balances[payer] += exp["amount"] - share
-        for uid in participants:
-            suid = str(uid)
-            balances.setdefault(suid, 0.0)
-            if suid != payer:
-                balances[suid] -= share
-    # Round to cents for stability
-    for k, v in balances.items():
-        balances[k] = round(v, 2)
-    return balances
-
-
-def greedy_settlement(balances: Dict[str, float]) -> List[Dict[str, Any]]:
-    creditors = []  # (user_id, amount > 0)
-    debtors = []    # (user_id, amount < 0)
-    for uid, amt in balances.items():
-        if amt > EPS:
-            creditors.append([uid, amt])
-        elif amt < -EPS:
-            debtors.append([uid, amt])
-    creditors.sort(key=lambda x: x[1], reverse=True)
-    debtors.sort(key=lambda x: x[1])  # most negative first
-    settlements = []
-    ci = 0
-    di = 0
-    while ci < len(creditors) and di < len(debtors):
-        c_uid, c_amt = creditors[ci]
-        d_uid, d_amt = debtors[di]
-        pay = min(c_amt, -d_amt)
-        settlements.append({
-            "from": d_uid,
-            "to": c_uid,
-            "amount": round(pay, 2)
-        })
-        c_amt -= pay
-        d_amt += pay
-        creditors[ci][1] = c_amt
-        debtors[di][1] = d_amt
-        if c_amt <= EPS:
-            ci += 1
-        if d_amt >= -EPS:
-            di += 1
-    return settlements
+    """Mark the chat's settings (currency, language) for a coalesced write; users/expenses are written directly."""
+    chat_id = data["chat_id"]
+    _CHAT_CACHE[chat_id] = data
+    _DIRTY[chat_id] = data
+    _FLUSH_EVENT.set()
+
+
+def _meta_from_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "language": data.get("language", "he"),
+        "currency": data.get("currency", DEFAULT_CURRENCY),
+        "has_users": bool(data.get("users")),
+    }
+
+
+async def get_chat_meta(chat_id: int) -> Dict[str, Any]:
+    """Return {language, currency, has_users} for the chat."""
+    return _meta_from_data(await load_chat_async(chat_id))
+
+
+def evict_chat(chat_id: int) -> None:
+    """Drop a chat from the cache without flushing (used when its rows are deleted)."""
+    _CHAT_CACHE.pop(chat_id, None)
+    _DIRTY.pop(chat_id, None)
+
+
+def _take_dirty() -> List[Tuple[int, str, str]]:
+    batch = [(chat_id, data["currency"], data["language"]) for chat_id, data in _DIRTY.items()]
+    _DIRTY.clear()
+    return batch
+
+
+def _write_batch(batch: List[Tuple[int, str, str]]) -> None:
+    if not batch:
+        return
+    try:
+        db_save_chat_settings(batch)
+    except Exception as e:  # pragma: no cover
+        log.warning("failed to flush chat settings for %d chats: %s", len(batch), e)
+
+
+def flush_dirty_chats() -> None:
+    _write_batch(_take_dirty())
+
+
+async def _flush_loop():
+    """Wake on save_chat, wait briefly so bursts coalesce, then write off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await _FLUSH_EVENT.wait()
+        await asyncio.sleep(_FLUSH_COALESCE)
+        _FLUSH_EVENT.clear()
+        batch = _take_dirty()
+        if batch:
+            await loop.run_in_executor(None, _write_batch, batch)
+
+
+atexit.register(flush_dirty_chats)
+
+
+async def _reply(msg, data: Dict[str, Any], key: str, **fmt):
+    """Reply silently with MSG[key] in the chat's language; formatted only when fmt is given."""
+    text = MSG[data["_he"]][key]
+    return await msg.reply_text(text.format(**fmt) if fmt else text, disable_notification=True)
 
 
 async def start(update, context):
     chat_id = update.message.chat.id
-    data = load_chat(chat_id)
-    lang = data.get("language", "he")
-    he = (lang == "he")
-    text = T["start"] if he else "👋 Hi! I'm the expense split bot. Type /help to see commands."
-    if not data["users"]:
-        text += "\n" + (T["prompt_adduser"] if he else "No participants yet. Use /adduser to add your name.")
+    meta = await get_chat_meta(chat_id)
+    he = (meta["language"] == "he")
+    m = MSG[he]
+    text = m["start"]
+    if not meta["has_users"]:
+        text += "\n" + m["prompt_adduser"]
     await update.message.reply_text(text, disable_notification=True)
 
 
 async def help_cmd(update, context):
-    chat_id = update.message.chat.id
-    data = load_chat(chat_id)
-    lang = data.get("language", "he")
-    he = (lang == "he")
-    currency = data.get("currency", DEFAULT_CURRENCY)
-    if he:
-        text = T["help"].replace("{currency}", currency)
-        if AI_PROVIDER_ACTIVE == "GEMINI":
-            text += "\n🤖 מצב AI: Gemini פעיל."
-        elif AI_PROVIDER_ACTIVE == "OLLAMA":
-            healthy = _check_ollama_health()
-            text += f"\n🤖 מצב AI: Ollama ({OLLAMA_MODEL}) {'פעיל' if healthy else 'לא זמין – מעבר לניתוח בסיסי'}"
-        else:
-            text += "\n🤖 מצב AI: כבוי (Regex בלבד)."
+    await _send_help(update.message, await load_chat_async(update.message.chat.id))
+
+
+async def _send_help(msg, data: Dict[str, Any]):
+    m = MSG[data["_he"]]
+    text = m["help"].replace("{currency}", data["currency"])
+    if AI_PROVIDER_ACTIVE == "GEMINI":
+        text += m["help_ai_gemini"].format(model=GEMINI_MODEL)
+    elif AI_PROVIDER_ACTIVE == "OLLAMA":
+        healthy = await _check_ollama_health_async()
+        text += m["help_ai_ollama"].format(model=OLLAMA_MODEL, base=OLLAMA_BASE_URL,
+                                           status=m["help_ollama_up" if healthy else "help_ollama_down"])
     else:
-        # Build English help dynamically to reflect AI status & currency
-        text = (
-            "📘 Commands:\n"
-            "ℹ️ /help - this help.\n"
-            "🚀 /start - welcome message.\n"
-            "💱 /setcurrency [ISO3] - set base currency before first expense.\n"
-            "💰 /currency - show current currency.\n"
-            "➕ /add <amount> [ISO3] <description> - add expense.\n"
-            "🧑‍🤝‍🧑 /adduser [name] - add virtual participant or set your name.\n"
-            "👥 /users - list participants.\n"
-            "🧾 /list [page] - list expenses (pagination arrows).\n"
-            "⚖️ /bal - weighted balances.\n"
-            "🤝 /settle - settlement suggestions.\n"
-            "🏷️ /categories - list categories.\n"
-            "📊 /stats - category totals.\n"
-            "🤖 /ai - AI provider status.\n"
-            "📤 /export - export CSV.\n"
-            "🌐 /lang - toggle language (Hebrew/English).\n"
-            "♻️ /reset - wipe all data (confirmation).\n"
-            "✍️ Free text like '120 ils falafel' creates a pending expense for confirmation.\n"
-            f"(Current currency: {currency})"
-        )
-        if AI_PROVIDER_ACTIVE == "GEMINI":
-            text += f"\n🤖 AI: Gemini model={GEMINI_MODEL} (healthy)"
-        elif AI_PROVIDER_ACTIVE == "OLLAMA":
-            healthy = _check_ollama_health()
-            text += f"\n🤖 AI: Ollama model={OLLAMA_MODEL} base={OLLAMA_BASE_URL} status={'healthy' if healthy else 'unreachable'}"
-        else:
-            text += "\n🤖 AI: disabled (regex fallback)."
-    await update.message.reply_text(text, disable_notification=True)
+        text += m["help_ai_off"]
+    await msg.reply_text(text, disable_notification=True)
 
 async def ai_status_cmd(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    lang = data.get("language", "he")
-    he = (lang == "he")
+    he = (await load_chat_async(chat_id))["_he"]
+    m = MSG[he]
     if AI_PROVIDER_ACTIVE == "GEMINI" and AI_ENABLED:
-        text = ("ספק AI: Gemini\nמודל: " + GEMINI_MODEL + "\nמצב: פעיל") if he else f"AI Provider: Gemini\nModel: {GEMINI_MODEL}\nStatus: active"
+        text = m["ai_status_gemini"].format(model=GEMINI_MODEL)
     elif AI_PROVIDER_ACTIVE == "OLLAMA" and AI_ENABLED:
-        healthy = _check_ollama_health(force=True)
-        if he:
-            text = f"ספק AI: Ollama\nמודל: {OLLAMA_MODEL}\nכתובת: {OLLAMA_BASE_URL}\nמצב: {'פעיל' if healthy else 'לא זמין'}"
-            if not healthy and _AI_LAST_ERROR:
-                text += f"\nשגיאה: {_AI_LAST_ERROR}"
-        else:
-            text = f"AI Provider: Ollama\nModel: {OLLAMA_MODEL}\nBase URL: {OLLAMA_BASE_URL}\nStatus: {'healthy' if healthy else 'unreachable'}"
-            if not healthy and _AI_LAST_ERROR:
-                text += f"\nError: {_AI_LAST_ERROR}"
+        healthy = await _check_ollama_health_async(force=True)
+        text = m["ai_status_ollama"].format(model=OLLAMA_MODEL, base=OLLAMA_BASE_URL, status=m["ai_up" if healthy else "ai_down"])
+        if not healthy and _AI_LAST_ERROR:
+            text += m["ai_status_error"].format(error=_AI_LAST_ERROR)
     else:
-        text = "AI כבוי: שימוש במנתח בסיסי." if he else "AI disabled: using regex parser."
+        text = m["ai_off"]
     await msg.reply_text(text, disable_notification=True)
 
 async def lang_cmd(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    current = data.get("language", "he")
-    new_lang = "en" if current == "he" else "he"
-    data["language"] = new_lang
-    save_chat(data)
-    global HE_IL
-    HE_IL = (new_lang == "he")  # legacy for code paths still using HE_IL
-    if new_lang == "he":
-        await msg.reply_text("✅ השפה הוחלפה לעברית.", disable_notification=True)
-    else:
-        await msg.reply_text("✅ Language switched to English.", disable_notification=True)
+    async with chat_lock(chat_id):
+        data = await load_chat_async(chat_id)
+        current = data.get("language", "he")
+        new_lang = "en" if current == "he" else "he"
+        data["language"] = new_lang
+        data["_he"] = new_lang == "he"
+        bump_revision(data)
+        save_chat(data)
+    await _reply(msg, data, "lang_switched")
     # Show help in new language
-    await help_cmd(update, context)
+    await _send_help(msg, data)
 
 
 async def categories_cmd(update, context):
-    listing = []
-    for c in CATEGORIES:
-        listing.append(f"{CATEGORY_EMOJI.get(c,'')} {c}")
-    if HE_IL:
-        await update.message.reply_text("קטגוריות:\n" + ", ".join(listing), disable_notification=True)
-    else:
-        await update.message.reply_text("Categories:\n" + ", ".join(listing), disable_notification=True)
+    m = MSG[(await load_chat_async(update.message.chat.id))["_he"]]
+    await update.message.reply_text(m["categories_header"] + "\n" + _CATEGORIES_DISPLAY, disable_notification=True)
+
+
+# Canonical categories plus synonyms, matched as whole words (plural -s/-es allowed) in one compiled scan (longest first)
+_CAT_LOOKUP: Dict[str, str] = {c: c for c in CATEGORIES} | CATEGORY_SYNONYMS
+_CAT_RE = re.compile(
+    r"\b(" + "|".join(re.escape(k) for k in sorted(_CAT_LOOKUP, key=len, reverse=True)) + r")(?:e?s)?\b",
+    re.IGNORECASE,
+)
 
 
 def normalize_category(raw: str) -> str:
     if not raw:
         return "other"
     r = raw.lower().strip()
-    if r in CATEGORIES:
-        return r
-    if r in CATEGORY_SYNONYMS:
-        return CATEGORY_SYNONYMS[r]
-    for k, v in CATEGORY_SYNONYMS.items():
-        if k in r:
-            return v
-    return "other"
+    hit = _CAT_LOOKUP.get(r)
+    if hit is not None:
+        return hit
+    m = _CAT_RE.search(r)
+    return _CAT_LOOKUP[m.group(1).lower()] if m else "other"
 
 
-async def ai_parse_expense(text: str, chat_currency: str) -> Dict[str, Any]:
-    def regex_fallback():
-        m = re.search(r"(\d+(?:[.,]\d+)?)", text)
-        if not m:
+def _extract_json(raw: str) -> Optional[str]:
+    """Return the first balanced {...} object in a model response (string/escape aware), else None."""
+    start = raw.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_str = False
+    escaped = False
+    for i in range(start, len(raw)):
+        ch = raw[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return raw[start:i + 1]
+    return None
+
+
+def _ollama_generate_json(prompt: str) -> Optional[str]:
+    """Stream /api/generate and return the first complete JSON object, closing the stream early.
+
+    Bounded by AI_TIMEOUT_S like the awaiting caller: wait_for can't stop this worker thread, so it
+    gives up on its own (per-read socket timeout plus an overall deadline) instead of streaming on.
+    """
+    deadline = time.monotonic() + AI_TIMEOUT_S
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": True}
+    with _OLLAMA_SESSION.post(f"{OLLAMA_BASE_URL}/api/generate", json=payload, stream=True,
+                              timeout=(AI_TIMEOUT_S, AI_TIMEOUT_S)) as resp:
+        if resp.status_code != 200:
+            logging.warning("Ollama HTTP %s", resp.status_code)
             return None
-        amt = float(m.group(1).replace(",", "."))
-        desc = text.replace(m.group(0), "").strip() or "(no description)"
-        cat = normalize_category(desc.split()[0]) if desc else "other"
-        return {"amount": round(amt, 2), "description": desc, "category": cat}
+        buf: List[str] = []
+        for line in resp.iter_lines():
+            if time.monotonic() > deadline:
+                return None  # the caller has already fallen back to the regex parser
+            if not line:
+                continue
+            chunk = _json.loads(line)
+            piece = chunk.get("response", "")
+            buf.append(piece)
+            if "}" in piece:
+                found = _extract_json("".join(buf))
+                if found:
+                    return found
+            if chunk.get("done"):
+                break
+    return _extract_json("".join(buf))
+
+
+# Recent parse results keyed by (normalized text, chat currency); re-sent messages skip the provider
+_PARSE_CACHE: "TTLCache[Tuple[str, str], Dict[str, Any]]" = TTLCache(maxsize=512, ttl=3600)
+_WS_RE = re.compile(r"\s+")
+
+
+async def ai_parse_expense(text: str, chat_currency: str) -> Dict[str, Any]:
+    """Parse free text into {amount, description, category}; repeats within the TTL skip the provider."""
+    key = (_WS_RE.sub(" ", text.strip().lower()), chat_currency)
+    cached = _PARSE_CACHE.get(key)
+    if cached is not None:
+        if log_ai.isEnabledFor(logging.DEBUG):
+            log_ai.debug("parse cache hit text=%s", key[0])
+        return dict(cached)
+    try:
+        result, from_provider = await asyncio.wait_for(_ai_parse_expense_uncached(text, chat_currency), timeout=AI_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        log_ai.warning("AI parse timed out after %.1fs, using regex parser", AI_TIMEOUT_S)
+        return _regex_parse_expense(text)
+    # Regex fallbacks aren't cached, so the text gets a real AI parse once the provider is back
+    if from_provider:
+        _PARSE_CACHE[key] = dict(result)
+    return result
+
+
+# Amount plus an optional currency symbol / ISO code right after it, e.g. 30₪, 12.5 eur
+_EXPENSE_RE = re.compile(r"(?P<amt>\d+(?:[.,]\d+)?)(?:\s*(?P<cur>[₪$€£]|[A-Za-z]{3}\b))?")
+
+
+def _regex_parse_expense(text: str) -> Dict[str, Any]:
+    """Offline parser. Also reports a currency written next to the amount so the caller can skip
+    the full detect_currency_token scan ("currency" is None when there isn't one)."""
+    m = _EXPENSE_RE.search(text)
+    if not m:
+        return {"amount": None, "description": text, "category": "other", "currency": None}
+    amt = float(m.group("amt").replace(",", "."))
+    cur = m.group("cur")
+    if cur is not None:
+        cur = CURRENCY_SYNONYMS.get(cur) or cur.upper()
+        if cur not in _COMMON_CURRENCIES_SET:
+            cur = None
+    # Drop only what was consumed: a non-currency word after the amount stays in the description
+    desc = text.replace(m.group(0) if cur else m.group("amt"), "").strip() or "(no description)"
+    cat = normalize_category(desc.split()[0]) if desc else "other"
+    return {"amount": round(amt, 2), "description": desc, "category": cat, "currency": cur}
+
+
+# Fixed part of the extraction prompt; only the currency and the message vary per call
+_PROMPT_PREFIX = (
+    "You are an expense extraction assistant. Return ONLY a JSON object with keys: "
+    "amount (number), description (string), category (one of food, groceries, transport, entertainment, travel, utilities, health, rent, other). "
+    "If unsure, pick 'other'. Currency context: "
+)
+
+
+async def _ai_parse_expense_uncached(text: str, chat_currency: str) -> Tuple[Dict[str, Any], bool]:
+    """Parse result plus whether it came from the AI provider (False for the regex fallback)."""
     if not AI_ENABLED or not AI_PROVIDER_ACTIVE:
-        return regex_fallback() or {"amount": None, "description": text, "category": "other"}
+        return _regex_parse_expense(text), False
     # Health gate for Ollama
-    if AI_PROVIDER_ACTIVE == "OLLAMA" and not _check_ollama_health():
-        return regex_fallback() or {"amount": None, "description": text, "category": "other"}
+    if AI_PROVIDER_ACTIVE == "OLLAMA" and not await _check_ollama_health_async():
+        return _regex_parse_expense(text), False
 
-    prompt = (
-        "You are an expense extraction assistant. Return ONLY a JSON object with keys: "
-        "amount (number), description (string), category (one of food, groceries, transport, entertainment, travel, utilities, health, rent, other). "
-        f"If unsure, pick 'other'. Currency context: {chat_currency}. Message: {text}"
-    )
+    prompt = _PROMPT_PREFIX + chat_currency + ". Message: " + text
     if AI_PROVIDER_ACTIVE == "GEMINI":
         try:
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            resp = await asyncio.to_thread(model.generate_content, prompt)
-            raw = getattr(resp, 'text', '').strip()
-            match = re.search(r"\{.*\}", raw, re.DOTALL)
+            resp = await _GEMINI_MODEL.generate_content_async(prompt)
+            try:
+                raw = resp.text.strip()
+            except ValueError:
+                # .text raises when the response has no single text part (multi-part / blocked)
+                parts = resp.candidates[0].content.parts if resp.candidates else []
+                raw = "".join(p.text for p in parts).strip()
+            match = _extract_json(raw)
             if match:
-                data = _json.loads(match.group(0))
+                data = _json.loads(match)
                 amount = data.get("amount")
                 desc = data.get("description") or "(no description)"
                 cat = normalize_category(data.get("category", ""))
                 if isinstance(amount, (int, float)) and amount > 0:
-                    return {"amount": round(float(amount), 2), "description": desc, "category": cat}
+                    return {"amount": round(float(amount), 2), "description": desc, "category": cat}, True
         except Exception as e:  # pragma: no cover
             logging.warning("Gemini parse failed: %s", e)
     elif AI_PROVIDER_ACTIVE == "OLLAMA":
-        # Ollama local API: POST /api/generate {model,prompt,stream:false}
+        # Ollama local API: POST /api/generate {model,prompt,stream:true}; stop at the first full JSON object
         try:
-            import http.client, urllib.parse, json as __json
-            from urllib.parse import urlparse
-            u = urlparse(OLLAMA_BASE_URL)
-            path = "/api/generate"
-            payload = __json.dumps({
-                "model": OLLAMA_MODEL,
-                "prompt": prompt + "\nReturn ONLY raw JSON.",
-                "stream": False,
-            })
-            conn = http.client.HTTPConnection(u.hostname, u.port or (80 if u.scheme == 'http' else 443), timeout=15)
-            conn.request("POST", path, body=payload, headers={"Content-Type": "application/json"})
-            resp = conn.getresponse()
-            if resp.status == 200:
-                body = resp.read().decode("utf-8", errors="ignore")
-                # Ollama returns JSON with 'response' field containing the model text
-                try:
-                    outer = __json.loads(body)
-                    raw_out = outer.get("response", "")
-                except Exception:
-                    raw_out = body
-                match = re.search(r"\{.*\}", raw_out, re.DOTALL)
-                if match:
-                    data = _json.loads(match.group(0))
-                    amount = data.get("amount")
-                    desc = data.get("description") or "(no description)"
-                    cat = normalize_category(data.get("category", ""))
-                    if isinstance(amount, (int, float)) and amount > 0:
-                        return {"amount": round(float(amount), 2), "description": desc, "category": cat}
-            else:
-                logging.warning("Ollama HTTP %s", resp.status)
+            match = await asyncio.to_thread(_ollama_generate_json, prompt + "\nReturn ONLY raw JSON.")
+            if match:
+                data = _json.loads(match)
+                amount = data.get("amount")
+                desc = data.get("description") or "(no description)"
+                cat = normalize_category(data.get("category", ""))
+                if isinstance(amount, (int, float)) and amount > 0:
+                    return {"amount": round(float(amount), 2), "description": desc, "category": cat}, True
         except Exception as e:  # pragma: no cover
             logging.warning("Ollama parse failed: %s", e)
-    return regex_fallback() or {"amount": None, "description": text, "category": "other"}
+    return _regex_parse_expense(text), False
 
 
 async def free_text_handler(update: Update, context):
@@ -754,34 +1257,44 @@ async def free_text_handler(update: Update, context):
     # Pending name capture overrides expense parsing
     if chat_id in PENDING_NAMES and PENDING_NAMES[chat_id] == msg.from_user.id:
         name = msg.text.strip()
-        data = load_chat(chat_id)
-        # Assign or update this user's display name (real user id stored positively)
-        ensure_user(data, msg.from_user)
-        data["users"][str(msg.from_user.id)] = name[:40]  # limit length
-        save_chat(data)
+        async with chat_lock(chat_id):
+            data = await load_chat_async(chat_id)
+            # Assign or update this user's display name (real user id stored positively)
+            await ensure_user(data, msg.from_user)
+            data["users"][str(msg.from_user.id)] = name[:40]  # limit length
+            data.pop("_user_names_lower", None)  # the old name may still be in it
+            bump_revision(data)
+            await asyncio.to_thread(db_ensure_user, chat_id, msg.from_user.id, name[:40])
         PENDING_NAMES.pop(chat_id, None)
-        await msg.reply_text(T["name_saved"].format(name=name) if HE_IL else f"Saved name: {name}", disable_notification=True)
+        await _reply(msg, data, "name_saved", name=name)
         return
-    data = load_chat(chat_id)
-    lang = data.get("language", "he")
-    he = (lang == "he")
-    if (not AI_ENABLED or (AI_PROVIDER_ACTIVE == "OLLAMA" and not _check_ollama_health())) and chat_id not in _notified_limited_mode:
+    # Updates run concurrently across chats; the chat lock keeps messages within one chat in order
+    async with chat_lock(chat_id):
+        await _free_text_expense(msg, chat_id)
+
+
+async def _free_text_expense(msg, chat_id: int) -> None:
+    data = await load_chat_async(chat_id)
+    m = MSG[data["_he"]]
+    ollama_ok = AI_PROVIDER_ACTIVE != "OLLAMA" or await _check_ollama_health_async()
+    if (not AI_ENABLED or not ollama_ok) and chat_id not in _notified_limited_mode:
         if AI_PROVIDER_ACTIVE == "OLLAMA" and AI_ENABLED:
-            warn = "שרת Ollama לא זמין – מעבר לניתוח בסיסי." if he else "Ollama unreachable – falling back to basic parser."
+            warn = m["ollama_down"]
         else:
-            warn = T["ai_disabled"] if he else "AI parsing disabled. Using basic parser."
+            warn = m["ai_disabled"]
         await msg.reply_text(warn, disable_notification=True)
-        _notified_limited_mode.add(chat_id)
+        _notified_limited_mode[chat_id] = True
     # Show a transient "thinking" indicator if AI provider active & healthy (Gemini or Ollama reachable)
     thinking_msg = None
-    need_ai = AI_ENABLED and AI_PROVIDER_ACTIVE and not (AI_PROVIDER_ACTIVE == "OLLAMA" and not _check_ollama_health())
+    need_ai = AI_ENABLED and AI_PROVIDER_ACTIVE and ollama_ok
     if need_ai:
         try:
-            thinking_msg = await msg.reply_text("🤖 חושב..." if he else "🤖 Thinking...", disable_notification=True)
+            thinking_msg = await msg.reply_text(m["thinking"], disable_notification=True)
         except Exception as _e:  # pragma: no cover
             thinking_msg = None
     parsed = await ai_parse_expense(msg.text, data.get("currency", DEFAULT_CURRENCY))
-    log_ai.debug("free_text parsed amount=%s desc=%s cat=%s", parsed.get("amount"), parsed.get("description"), parsed.get("category"))
+    if log_ai.isEnabledFor(logging.DEBUG):
+        log_ai.debug("free_text parsed amount=%s desc=%s cat=%s", parsed.get("amount"), parsed.get("description"), parsed.get("category"))
     amount = parsed.get("amount")
     if not amount:
         if thinking_msg:
@@ -789,37 +1302,33 @@ async def free_text_handler(update: Update, context):
                 await thinking_msg.delete()
             except Exception:  # pragma: no cover
                 pass
-        await msg.reply_text(T["amount_not_found"] if he else "Couldn't detect an amount.", disable_notification=True)
+        await msg.reply_text(m["amount_not_found"], disable_notification=True)
         return
-    ensure_user(data, msg.from_user)
-    participants = list(map(int, data["users"].keys()))
+    await ensure_user(data, msg.from_user)
+    participants = participant_ids(data)[:]
     payer_id = msg.from_user.id
-    if payer_id not in participants:
+    if payer_id not in data["_participant_id_set"]:
         participants.append(payer_id)
     # Currency detection & conversion for free text similar to /add
     # Detect currency FIRST on the original user message to avoid losing a trailing token like 'דולר'
     original_message_text = msg.text
-    initial_detected = detect_currency_token(original_message_text)
+    initial_detected = parsed.get("currency") or detect_currency_token(original_message_text)
     description = parsed.get("description", "(no description)")
     # Strip trailing currency word/symbol duplicates (Hebrew forms) so they don't pollute description output
     desc_tokens = description.strip().split()
     if desc_tokens:
-        last = desc_tokens[-1].lower()
-        last_norm = last.replace("ש״ח", "ש""ח")
-        if last_norm in CURRENCY_SYNONYMS or last_norm in {c.lower() for c in COMMON_CURRENCIES}:
+        last_norm = unicodedata.normalize("NFC", desc_tokens[-1].lower().rstrip(".,?!"))
+        if last_norm in _CURRENCY_WORDS:
             desc_tokens = desc_tokens[:-1]
     # After removing a trailing currency token we may have a dangling Hebrew preposition 'ב' (meaning 'for/at') or other short connector.
-    connectors = {"ב", "על", "עם", "for", "at", "on", "to"}
-    while desc_tokens and desc_tokens[-1].lower() in connectors:
+    while desc_tokens and desc_tokens[-1].lower() in _CONNECTORS:
         desc_tokens.pop()
     if desc_tokens:
         description = " ".join(desc_tokens).strip()
     else:
         description = "(no description)"
-    if initial_detected:
-        detected_cur = initial_detected
-    else:
-        detected_cur = detect_currency_token(description) or data.get("currency", DEFAULT_CURRENCY)
+    # The description is derived from the message text, so one scan of the message is enough
+    detected_cur = initial_detected or data.get("currency", DEFAULT_CURRENCY)
     chat_cur = data.get("currency", DEFAULT_CURRENCY)
     original_amount = round(amount, 2)
     original_currency = detected_cur
@@ -827,7 +1336,7 @@ async def free_text_handler(update: Update, context):
     fx_fallback = False
     final_amount = original_amount
     if detected_cur != chat_cur:
-        rate, fb = get_fx_rate(detected_cur, chat_cur)
+        rate, fb = await get_fx_rate_async(detected_cur, chat_cur)
         if rate:
             final_amount = round(final_amount * rate, 2)
             rate_used = rate
@@ -847,43 +1356,21 @@ async def free_text_handler(update: Update, context):
         "fx_fallback": fx_fallback,
     }
     PENDING_EXPENSES[chat_id] = pending
-    preview_id = get_next_expense_id(chat_id)
-    if rate_used:
-        # Use final_amount (converted) for primary amount display; always show base chat currency (chat_cur)
-        preview = T["auto_added_conv"].format(
-            id=preview_id, amt=final_amount, cur=chat_cur,
-            oamt=original_amount, ocur=original_currency, rate=rate_used,
-            cat=pending['category'], desc=pending['description']
-        )
-        # Add approximate marker if FX fallback strategy used (bridged/static)
-        if fx_fallback:
-            preview = preview.replace(f"{final_amount:.2f} {chat_cur}", f"{final_amount:.2f}~ {chat_cur}")
-        preview = f"{CATEGORY_EMOJI.get(pending['category'],'')} " + preview
-    else:
-        # If detected currency differs but we lacked a rate, still show original for clarity
-        if original_currency != chat_cur:
-            if fx_fallback:
-                preview = T["auto_added"].format(id=preview_id, amt=final_amount, cur=chat_cur,
-                                                  cat=pending['category'], desc=pending['description']) + \
-                          f" (מקור: {original_amount:.2f} {original_currency} {T['approx_rate']})"
-                preview = f"{CATEGORY_EMOJI.get(pending['category'],'')} " + preview
-            else:
-                preview = T["auto_added"].format(id=preview_id, amt=final_amount, cur=chat_cur,
-                                                  cat=pending['category'], desc=pending['description']) + \
-                          f" (מקור: {original_amount:.2f} {original_currency} ללא המרה)"
-                preview = f"{CATEGORY_EMOJI.get(pending['category'],'')} " + preview
-        else:
-            preview = T["auto_added"].format(id=preview_id, amt=final_amount, cur=chat_cur,
-                                              cat=pending['category'], desc=pending['description'])
-            preview = f"{CATEGORY_EMOJI.get(pending['category'],'')} " + preview
-    preview += ("\nמאשר?" if he else "\nApprove?")
+    # The id is only known once the expense is inserted on approval, so the preview shows "#?"
+    # "~" marks an approximate rate (bridged/stale/static FX fallback)
+    preview = _PREVIEW_TEMPLATES[data["_he"]][(bool(rate_used), original_currency != chat_cur, fx_fallback)].format(
+        id="?", amt=final_amount, approx="~" if fx_fallback else "", cur=chat_cur,
+        oamt=original_amount, ocur=original_currency, rate=rate_used,
+        cat=pending['category'], desc=pending['description'], approx_rate=m["approx_rate"],
+    )
+    preview = CATEGORY_PREFIX.get(pending['category'], " ") + preview + m["approve"]
     # Remove thinking indicator before sending preview
     if thinking_msg:
         try:
             await thinking_msg.delete()
         except Exception:  # pragma: no cover
             pass
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("✅ אישור" if he else "✅ Yes", callback_data="AIEXP:ACCEPT"), InlineKeyboardButton("❌ ביטול" if he else "❌ Cancel", callback_data="AIEXP:CANCEL")]])
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(m["btn_yes"], callback_data="AIEXP:ACCEPT"), InlineKeyboardButton(m["btn_cancel"], callback_data="AIEXP:CANCEL")]])
     await msg.reply_text(preview, reply_markup=keyboard, disable_notification=True)
 
 
@@ -891,10 +1378,14 @@ def _is_currency(token: str) -> bool:
     return len(token) == 3 and token.isalpha()
 
 
+# /add[@bot] <amount> [ISO3] [description...] in one match
+_ADD_RE = re.compile(r"^/add(?:@\S+)?\s+(\S+)(?:\s+([A-Za-z]{3})(?!\S))?\s*(.*)$", re.S)
+
+
 async def set_currency(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
+    data = await load_chat_async(chat_id)
     parts = msg.text.strip().split()
     if len(parts) == 1:
         keyboard = [
@@ -903,165 +1394,200 @@ async def set_currency(update, context):
             [InlineKeyboardButton(INLINE_CURRENCIES[6], callback_data=f"CUR:{INLINE_CURRENCIES[6]}")],
         ]
         await msg.reply_text(
-            (T["choose_currency"].format(cur=data['currency']) if HE_IL else f"Current currency: {data['currency']}. Choose new (disabled after first expense):"),
+            MSG[data["_he"]]["choose_currency"].format(cur=data['currency']),
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         return
     if len(parts) != 2:
-        await msg.reply_text(T["usage_setcurrency"] if HE_IL else "Usage: /setcurrency <ISO3>", disable_notification=True)
+        await _reply(msg, data, "usage_setcurrency")
         return
     code = parts[1].upper()
     if not _is_currency(code):
-        await msg.reply_text(T["bad_currency"] if HE_IL else "Currency must be a 3-letter ISO code.", disable_notification=True)
+        await _reply(msg, data, "bad_currency")
         return
-    if data["expenses"] and code != data["currency"]:
-        await msg.reply_text(T["currency_locked"].format(cur=data['currency']) if HE_IL else f"Cannot change currency after expenses exist (still {data['currency']}).", disable_notification=True)
+    # Check for expenses and switch under the chat lock so a concurrent /add can't slip in between
+    async with chat_lock(chat_id):
+        data = await load_chat_async(chat_id)
+        old = data["currency"]
+        locked = code != old and await asyncio.to_thread(db_count_expenses, chat_id)
+        if code != old and not locked:
+            data["currency"] = code
+            save_chat(data)
+    if locked:
+        await _reply(msg, data, "currency_locked", cur=old)
         return
-    if code == data["currency"]:
-        await msg.reply_text(T["currency_already"].format(cur=code) if HE_IL else f"Currency already set to {code}.", disable_notification=True)
+    if code == old:
+        await _reply(msg, data, "currency_already", cur=code)
         return
-    old = data["currency"]
-    data["currency"] = code
-    save_chat(data)
     logging.info("[setcurrency] chat=%s old=%s new=%s", chat_id, old, code)
-    await msg.reply_text(T["currency_changed"].format(old=old, new=code) if HE_IL else f"Default currency changed: {old} -> {code}.", disable_notification=True)
+    context.application.create_task(asyncio.to_thread(prefetch_fx, code, INLINE_CURRENCIES))
+    await _reply(msg, data, "currency_changed", old=old, new=code)
 
 
 async def show_currency(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    cur = data.get('currency', DEFAULT_CURRENCY)
-    await msg.reply_text(T["current_currency"].format(cur=cur) if HE_IL else f"Current currency: {cur}", disable_notification=True)
+    data = await load_chat_async(chat_id)
+    await _reply(msg, data, "current_currency", cur=data["currency"])
+
 
+def participant_ids(data: Dict[str, Any]) -> List[int]:
+    """Int ids of data["users"], built once per cached chat (with a companion set for membership tests)."""
+    ids = data.get("_participant_ids")
+    if ids is None:
+        ids = data["_participant_ids"] = [int(u) for u in data["users"]]
+        data["_participant_id_set"] = set(ids)
+    return ids
 
-def ensure_user(data: Dict[str, Any], user) -> None:
+
+def user_names_lower(data: Dict[str, Any]) -> set:
+    """Lowercased display names in data["users"], built once per cached chat (duplicate-name checks)."""
+    names = data.get("_user_names_lower")
+    if names is None:
+        names = data["_user_names_lower"] = {v.lower() for v in data["users"].values()}
+    return names
+
+
+def virtual_uids(data: Dict[str, Any]) -> set:
+    """data["users"] keys of virtual (negative id) participants, built once per cached chat."""
+    virt = data.get("_virtual_uids")
+    if virt is None:
+        virt = data["_virtual_uids"] = {u for u in data["users"] if u.startswith('-')}
+    return virt
+
+
+def _add_participant_id(data: Dict[str, Any], uid: int) -> None:
+    if "_participant_ids" in data and uid not in data["_participant_id_set"]:
+        data["_participant_ids"].append(uid)
+        data["_participant_id_set"].add(uid)
+    if uid < 0 and "_virtual_uids" in data:
+        data["_virtual_uids"].add(str(uid))
+
+
+async def ensure_user(data: Dict[str, Any], user) -> None:
     uid = str(user.id)
-    if uid not in data["users"]:
-        data["users"][uid] = user.first_name or f"User{uid}"
+    if uid in data["users"]:
+        return  # data["users"] is loaded from SQLite, so a known user is already stored
+    data["users"][uid] = user.first_name or f"User{uid}"
+    _add_participant_id(data, user.id)
+    if "_user_names_lower" in data:
+        data["_user_names_lower"].add(data["users"][uid].lower())
     # DB persistence
     try:
-        db_ensure_user(data['chat_id'], int(uid), data["users"][uid])
+        await asyncio.to_thread(db_ensure_user, data['chat_id'], int(uid), data["users"][uid])
     except Exception as e:  # pragma: no cover
         log.warning("failed to ensure user in db: %s", e)
 
-def add_virtual_user(data: Dict[str, Any], name: str) -> bool:
+async def add_virtual_user(data: Dict[str, Any], name: str) -> bool:
     # Returns True if added, False if duplicate
     norm = name.strip()
     if not norm:
         return False
     # Check duplicates case-insensitive
-    existing_lower = {v.lower(): k for k, v in data["users"].items()}
-    if norm.lower() in existing_lower:
+    names_lower = user_names_lower(data)
+    if norm.lower() in names_lower:
         return False
-    vid = data.get("virtual_seq", -1)
-    data["users"][str(vid)] = norm
-    data["virtual_seq"] = vid - 1
-    # DB
+    # The DB allocates the (negative) virtual id
     try:
-        added_id = db_add_virtual_user(data['chat_id'], norm)
-        if added_id is not None and str(added_id) != str(vid):
-            # align json virtual_seq if mismatch
-            data["virtual_seq"] = added_id - 1
+        vid = await asyncio.to_thread(db_add_virtual_user, data['chat_id'], norm)
     except Exception as e:  # pragma: no cover
         log.warning("failed to add virtual user in db: %s", e)
+        return False
+    if vid is None:
+        return False
+    data["users"][str(vid)] = norm
+    names_lower.add(norm.lower())
+    _add_participant_id(data, vid)
+    data["virtual_seq"] = vid - 1
     return True
 
 async def adduser_cmd(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
+    data = await load_chat_async(chat_id)
     parts = msg.text.strip().split(maxsplit=1)
     # If user supplies a name directly, treat as virtual participant add (legacy behavior)
     if len(parts) == 2 and parts[1].strip():
         name = parts[1].strip()
-        added = add_virtual_user(data, name)
+        async with chat_lock(chat_id):
+            added = await add_virtual_user(data, name)
         if not added:
-            await msg.reply_text(T["user_exists"] if HE_IL else "User already exists.", disable_notification=True)
+            await _reply(msg, data, "user_exists")
             return
-        save_chat(data)
-        await msg.reply_text(T["user_added"].format(name=name) if HE_IL else f"Added user: {name}", disable_notification=True)
+        await _reply(msg, data, "user_added", name=name)
         return
     # No name given: initiate personal name capture for the invoking Telegram user
     PENDING_NAMES[chat_id] = msg.from_user.id
-    await msg.reply_text(T["ask_name"] if HE_IL else "Send your display name in one message.", disable_notification=True)
+    await _reply(msg, data, "ask_name")
 
 async def users_cmd(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
+    data = await load_chat_async(chat_id)
+    m = MSG[data["_he"]]
     if not data["users"]:
-        await msg.reply_text(T["no_other_users"] if HE_IL else "No participants yet.", disable_notification=True)
+        await msg.reply_text(m["no_other_users"], disable_notification=True)
         return
-    lines = []
-    for uid, name in data["users"].items():
-        marker = "(וירטואלי)" if uid.startswith('-') else ""
-        if not HE_IL:
-            marker = "(virtual)" if uid.startswith('-') else ""
-        lines.append(f"{name} {marker}".strip())
-    header = T["users_header"] if HE_IL else "Participants:"
+    virtual = m["virtual"]
+    virt = virtual_uids(data)
+    lines = [f"{name} {virtual}" if uid in virt else name.strip() for uid, name in data["users"].items()]
+    header = m["users_header"]
     await msg.reply_text(header + "\n" + "\n".join(lines), disable_notification=True)
 
 async def stats_cmd(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    total = db_count_expenses(chat_id)
-    if total == 0:
-        await msg.reply_text(T["no_expenses"] if HE_IL else "No expenses yet.")
+    data = await load_chat_async(chat_id)
+    m = MSG[data["_he"]]
+    rows = await asyncio.to_thread(category_totals, chat_id)
+    if not rows:
+        await msg.reply_text(m["no_expenses"])
         return
-    rows = category_totals(chat_id)
-    currency = load_chat(chat_id).get("currency", DEFAULT_CURRENCY)
+    currency = data["currency"]
     grand = sum(v for _, v in rows) or 1.0
-    lines = []
-    for cat, amt in rows:
-        pct = (amt / grand) * 100.0
-        lines.append(f"{CATEGORY_EMOJI.get(cat,'')} {cat}: {amt:.2f} {currency} ({pct:.1f}%)")
-    header = "📊 קטגוריות:" if HE_IL else "Category totals:" 
+    prefix = CATEGORY_PREFIX.get
+    lines = [f"{prefix(cat, ' ')}{cat}: {amt:.2f} {currency} ({amt / grand * 100.0:.1f}%)" for cat, amt in rows]
+    header = m["stats_header"]
     await msg.reply_text(header + "\n" + "\n".join(lines), disable_notification=True)
 
 
 async def add_expense(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    ensure_user(data, msg.from_user)
-    tokens = msg.text.split()
-    if len(tokens) < 2:
-        await msg.reply_text(T["add_usage"] if HE_IL else "Usage: /add <amount> [ISO3] <description>")
+    data = await load_chat_async(chat_id)
+    m = MSG[data["_he"]]
+    await ensure_user(data, msg.from_user)
+    parsed = _ADD_RE.match(msg.text)
+    if not parsed:
+        await msg.reply_text(m["add_usage"])
         return
-    # tokens[0] = /add
-    amount_part = tokens[1]
+    amount_part, provided_currency, description = parsed.group(1, 2, 3)
     currency = data["currency"]
-    desc_start_index = 2
-    provided_currency = None
-    if len(tokens) >= 3 and _is_currency(tokens[2].upper()):
-        provided_currency = tokens[2].upper()
-        desc_start_index = 3
-    if len(tokens) <= desc_start_index:
-        description = "(no description)"
-    else:
-        description = " ".join(tokens[desc_start_index:])
+    if provided_currency:
+        provided_currency = provided_currency.upper()
+    description = description.strip() or "(no description)"
     try:
         amount = float(amount_part)
         if amount <= 0:
             raise ValueError
     except ValueError:
-        await msg.reply_text(T["amount_positive"] if HE_IL else "Amount must be positive.")
+        await msg.reply_text(m["amount_positive"])
         return
     # participants = all known users for now (including payer)
-    participants = list(map(int, data["users"].keys()))
+    participants = participant_ids(data)[:]
     payer_id = msg.from_user.id
-    if payer_id not in participants:
+    if payer_id not in data["_participant_id_set"]:
         participants.append(payer_id)
     detected_cur = provided_currency or detect_currency_token(description) or data["currency"]
-    log_currency.debug("/add detected_cur=%s provided=%s desc=%s", detected_cur, provided_currency, description)
+    if log_currency.isEnabledFor(logging.DEBUG):
+        log_currency.debug("/add detected_cur=%s provided=%s desc=%s", detected_cur, provided_currency, description)
     original_amount = round(amount, 2)
     original_currency = detected_cur
     final_amount = original_amount
     rate_used = None
     fx_fallback_flag = False
     if detected_cur != data["currency"]:
-        rate, fb = get_fx_rate(detected_cur, data["currency"])
+        rate, fb = await get_fx_rate_async(detected_cur, data["currency"])
         if rate:
             final_amount = round(final_amount * rate, 2)
             rate_used = rate
@@ -1070,7 +1596,8 @@ async def add_expense(update, context):
         else:
             fx_fallback_flag = True
             log_currency.debug("/add conversion failed from=%s to=%s", detected_cur, data["currency"])
-    exp_id = insert_expense(
+    exp_id = await asyncio.to_thread(
+        insert_expense,
         chat_id=chat_id,
         payer_id=payer_id,
         amount=final_amount,
@@ -1081,20 +1608,19 @@ async def add_expense(update, context):
         original_amount=original_amount,
         original_currency=original_currency,
         fx_rate=rate_used,
-    fx_fallback=fx_fallback_flag,
+        fx_fallback=fx_fallback_flag,
     )
+    bump_revision(data)
     exp = {"id": exp_id, "amount": final_amount, "original_amount": original_amount, "original_currency": original_currency, "fx_rate": rate_used}
     if rate_used:
         await msg.reply_text(
-            (f"{CATEGORY_EMOJI.get('other','')} " + T["expense_recorded_conv"].format(id=exp_id, amt=exp['amount'], cur=currency,
-                                               oamt=original_amount, ocur=original_currency, rate=rate_used, n=len(participants)))
-            if HE_IL else f"Recorded expense #{exp['id']} {exp['amount']:.2f} {currency} (from {original_amount:.2f} {original_currency} @ {rate_used:.4f}) split among {len(participants)} participants.",
+            CATEGORY_PREFIX["other"] + m["expense_recorded_conv"].format(id=exp_id, amt=exp['amount'], cur=currency,
+                                               oamt=original_amount, ocur=original_currency, rate=rate_used, n=len(participants)),
             disable_notification=True
         )
     else:
         await msg.reply_text(
-            (f"{CATEGORY_EMOJI.get('other','')} " + T["expense_recorded"].format(id=exp_id, amt=exp['amount'], cur=currency, n=len(participants)))
-            if HE_IL else f"Recorded expense #{exp['id']} {exp['amount']:.2f} {currency} split among {len(participants)} participants.",
+            CATEGORY_PREFIX["other"] + m["expense_recorded"].format(id=exp_id, amt=exp['amount'], cur=currency, n=len(participants)),
             disable_notification=True
         )
 
@@ -1102,152 +1628,173 @@ async def add_expense(update, context):
 async def list_expenses(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    users = data["users"]
-    currency = data.get("currency", DEFAULT_CURRENCY)
-    total = db_count_expenses(chat_id)
-    if total == 0:
-        await msg.reply_text(T["no_expenses"] if HE_IL else "No expenses yet.")
-        return
     # Optional page argument: /list <page>
     page = 0
     parts = msg.text.split()
     if len(parts) == 2 and parts[1].isdigit():
-        req = int(parts[1]) - 1
-        pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
-        if 0 <= req < pages:
-            page = req
-    expenses = db_list_expenses(chat_id, PAGE_SIZE, page * PAGE_SIZE)
-    text = build_expense_page_text(expenses, users, currency, page, total)
-    keyboard = build_pagination_keyboard(page, total)
+        page = max(int(parts[1]) - 1, 0)
+    # Page rows and the chat's total come back from one statement
+    data, (expenses, total) = await load_chat_with(chat_id, db_list_expenses_page, chat_id, PAGE_SIZE, page * PAGE_SIZE)
+    users = data["users"]
+    currency = data.get("currency", DEFAULT_CURRENCY)
+    if total == 0:
+        await msg.reply_text(MSG[data["_he"]]["no_expenses"])
+        return
+    if page and page * PAGE_SIZE >= total:
+        # Requested page is past the end: fall back to the first page
+        page = 0
+        expenses, total = await asyncio.to_thread(db_list_expenses_page, chat_id, PAGE_SIZE, 0)
+    text = build_expense_page_text(expenses, users, currency, page, total, data["_he"])
+    keyboard = build_pagination_keyboard(page, total, expenses)
     await msg.reply_text(text, reply_markup=keyboard, disable_notification=True)
 
-def build_expense_page_text(expenses: List[Dict[str, Any]], users: Dict[str,str], currency: str, page: int, total: int) -> str:
-    lines = []
-    for exp in expenses:
-        payer_name = users.get(str(exp["payer"]), str(exp["payer"]))
-        cat = exp.get("category", "other")
-        if exp.get("original_currency") and exp.get("original_currency") != currency:
-            if exp.get("fx_rate"):
-                approx = "~" if exp.get("fx_fallback") else ""
-                lines.append(
-                    (f"{CATEGORY_EMOJI.get(cat,'')} #{exp['id']} {payer_name} שילם {exp['amount']:.2f}{approx} {currency} (מ-{(exp.get('original_amount') or 0):.2f} {exp.get('original_currency')} @ {exp.get('fx_rate'):.4f}) [{cat}] - {exp['description']}") if HE_IL else
-                    (f"{CATEGORY_EMOJI.get(cat,'')} #{exp['id']} {payer_name} paid {exp['amount']:.2f}{approx} {currency} (from {(exp.get('original_amount') or 0):.2f} {exp.get('original_currency')} @ {exp.get('fx_rate'):.4f}) [{cat}] - {exp['description']}")
-                )
+def build_expense_page_text(expenses: List[Dict[str, Any]], users: Dict[str,str], currency: str, page: int, total: int, he: bool = True) -> str:
+    m = MSG[he]
+    row_conv, row_orig, row_plain = m["row_conv"], m["row_orig"], m["row_plain"]
+    emoji = CATEGORY_EMOJI.get
+    names: Dict[int, str] = {}  # payer id -> display name, resolved once per page
+
+    def _rows():
+        for exp in expenses:
+            uid = exp["payer"]
+            payer = names.get(uid)
+            if payer is None:
+                sid = str(uid)
+                payer = names[uid] = users.get(sid, sid)
+            cat = exp.get("category", "other")
+            ocur = exp.get("original_currency")
+            view = {
+                "emoji": emoji(cat, ''), "id": exp["id"], "payer": payer,
+                "amt": exp["amount"], "cur": currency, "cat": cat, "desc": exp["description"],
+            }
+            if ocur and ocur != currency:
+                view["approx"] = "~" if exp.get("fx_fallback") else ""
+                view["oamt"] = exp.get("original_amount") or 0
+                view["ocur"] = ocur
+                view["rate"] = exp.get("fx_rate")
+                yield (row_conv if view["rate"] else row_orig).format_map(view)
             else:
-                approx = "~" if exp.get("fx_fallback") else ""
-                lines.append(
-                    f"{CATEGORY_EMOJI.get(cat,'')} #{exp['id']} {payer_name} שילם {exp['amount']:.2f}{approx} {currency} (מ-{(exp.get('original_amount') or 0):.2f} {exp.get('original_currency')}) [{cat}] - {exp['description']}" if HE_IL else
-                    f"{CATEGORY_EMOJI.get(cat,'')} #{exp['id']} {payer_name} paid {exp['amount']:.2f}{approx} {currency} (from {(exp.get('original_amount') or 0):.2f} {exp.get('original_currency')}) [{cat}] - {exp['description']}"
-                )
-        else:
-            lines.append(
-                f"{CATEGORY_EMOJI.get(cat,'')} #{exp['id']} {payer_name} שילם {exp['amount']:.2f} {currency} [{cat}] - {exp['description']}" if HE_IL else
-                f"{CATEGORY_EMOJI.get(cat,'')} #{exp['id']} {payer_name} paid {exp['amount']:.2f} {currency} [{cat}] - {exp['description']}"
-            )
-    header = (T["expenses_header"].format(cur=currency) if HE_IL else f"Expenses [{currency}]:")
+                yield row_plain.format_map(view)
+
+    header = m["expenses_header"].format(cur=currency)
     pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
     footer = f"\n(Page {page+1}/{pages} • {total} total)"
-    return header + "\n" + "\n".join(lines) + footer
+    return header + "\n" + "\n".join(_rows()) + footer
+
+
+_SMALL_INT: Dict[str, int] = {str(i): i for i in range(1000)}
+
+
+def _page_number(token: str) -> int:
+    """Page index from callback data; small pages come from a lookup table instead of int()."""
+    n = _SMALL_INT.get(token)
+    return n if n is not None else int(token)
 
 
-def build_pagination_keyboard(page: int, total: int) -> InlineKeyboardMarkup:
+def build_pagination_keyboard(page: int, total: int, expenses: List[Dict[str, Any]]) -> InlineKeyboardMarkup:
+    """Arrow buttons carry a keyset cursor: LIST:<N|P>:<target page>:<boundary expense id>."""
+    if not expenses:
+        return None
     pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
-    buttons = []
+    return _pagination_keyboard(page, pages, expenses[0]['id'], expenses[-1]['id'])
+
+
+@lru_cache(maxsize=512)
+def _pagination_keyboard(page: int, pages: int, first_id: int, last_id: int) -> Optional[InlineKeyboardMarkup]:
+    # InlineKeyboardMarkup is immutable once built, so one instance can be shared between replies
     nav = []
     if page > 0:
-        nav.append(InlineKeyboardButton("⬅️", callback_data=f"LIST:{page-1}"))
+        nav.append(InlineKeyboardButton("⬅️", callback_data=f"LIST:P:{page-1}:{first_id}"))
     if page < pages - 1:
-        nav.append(InlineKeyboardButton("➡️", callback_data=f"LIST:{page+1}"))
-    if nav:
-        buttons.append(nav)
-    return InlineKeyboardMarkup(buttons) if buttons else None
+        nav.append(InlineKeyboardButton("➡️", callback_data=f"LIST:N:{page+1}:{last_id}"))
+    return InlineKeyboardMarkup([nav]) if nav else None
 
 
 async def show_balances(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    total = db_count_expenses(chat_id)
-    if total == 0:
-        await msg.reply_text(T["no_expenses"] if HE_IL else "No expenses yet.", disable_notification=True)
+    data, balances_map = await load_chat_with(chat_id, db_compute_balances, chat_id)
+    m = MSG[data["_he"]]
+    if not balances_map:
+        await msg.reply_text(m["no_expenses"], disable_notification=True)
         return
-    balances_map = db_compute_balances(chat_id)
     users = data["users"]
-    lines = []
     currency = data.get("currency", DEFAULT_CURRENCY)
-    for uid, amt in sorted(balances_map.items(), key=lambda x: x[0]):
-        if abs(amt) < EPS:
-            continue
-        lines.append(f"{users.get(uid, uid)}: {amt:+.2f} {currency}")
+    lines = [
+        f"{users.get(str(uid), uid)}: {amt:+.2f} {currency}"
+        for uid, amt in balances_map.items()  # already ordered by user id
+        if abs(amt) >= EPS
+    ]
     if not lines:
         if len(data["users"]) <= 1:
-            await msg.reply_text(T.get("balances_zero_one", T["balances_zero"]) if HE_IL else "All settled (only one participant).", disable_notification=True)
+            await msg.reply_text(m["balances_zero_one"], disable_notification=True)
         else:
-            await msg.reply_text(T["balances_zero"] if HE_IL else "All settled: balances are zero.", disable_notification=True)
+            await msg.reply_text(m["balances_zero"], disable_notification=True)
     else:
-        header = T["balances_header"].format(cur=currency) if HE_IL else f"Balances [{currency}]:"
+        header = m["balances_header"].format(cur=currency)
         await msg.reply_text(header + "\n" + "\n".join(lines), disable_notification=True)
 
 
 async def settle(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    data = load_chat(chat_id)
-    total = db_count_expenses(chat_id)
-    if total == 0:
-        await msg.reply_text(T["no_expenses"] if HE_IL else "No expenses yet.", disable_notification=True)
+    data, balances_map = await load_chat_with(chat_id, db_compute_balances, chat_id)
+    m = MSG[data["_he"]]
+    if not balances_map:
+        await msg.reply_text(m["no_expenses"], disable_notification=True)
         return
-    balances_map = db_compute_balances(chat_id)
     settlements = db_list_settlements(balances_map)
     if not settlements:
-        await msg.reply_text(T["settle_none"] if HE_IL else "Nothing to settle.", disable_notification=True)
+        await msg.reply_text(m["settle_none"], disable_notification=True)
         return
-    # Merge DB users (authoritative) with legacy JSON names as fallback
-    db_users = db_list_users(chat_id)  # Dict[int,str]
-    json_users = {int(k): v for k, v in data["users"].items()}
-    merged_users = {**json_users, **db_users}
-    lines = []
+    # data["users"] is loaded from the users table, so it already holds every name
+    users = data["users"]
     currency = data.get("currency", DEFAULT_CURRENCY)
-    for s in settlements:
-        payer = merged_users.get(s["from"], s["from"])
-        payee = merged_users.get(s["to"], s["to"])
-        if HE_IL:
-            lines.append(f"{payer} -> {payee}: {s['amount']:.2f} {currency}")
-        else:
-            lines.append(f"{payer} -> {payee}: {s['amount']:.2f} {currency}")
-    header = T["settle_header"].format(cur=currency) if HE_IL else f"Suggested payments [{currency}]:"
+    lines = [
+        f"{users.get(str(s['from']), s['from'])} -> {users.get(str(s['to']), s['to'])}: {s['amount']:.2f} {currency}"
+        for s in settlements
+    ]
+    header = m["settle_header"].format(cur=currency)
     await msg.reply_text(header + "\n" + "\n".join(lines), disable_notification=True)
 
+def _export_csv(chat_id: int, currency: str) -> Optional[io.BytesIO]:
+    """Blocking part of /export: stream expense rows from SQLite into CSV bytes (None when there are none)."""
+    rows = db_export_expenses(chat_id)
+    first = next(rows, None)
+    if first is None:
+        return None
+    # Build CSV straight into a bytes buffer (no intermediate str + encode copy)
+    buf = io.BytesIO()
+    tw = io.TextIOWrapper(buf, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(tw)
+    writer.writerow(["id","payer","amount","currency","description","category","timestamp_iso","original_amount","original_currency","fx_rate","fx_fallback","participants"])
+    strftime, gmtime = time.strftime, time.gmtime
+    writer.writerows(
+        (
+            r['id'], r['payer'], f"{r['amount']:.2f}", currency, r['description'], r['category'],
+            strftime("%Y-%m-%dT%H:%M:%S", gmtime(r['ts'])),
+            ("" if r['original_amount'] is None else f"{r['original_amount']:.2f}"), r['original_currency'] or "",
+            ("" if r['fx_rate'] is None else f"{r['fx_rate']:.6f}"), int(r.get('fx_fallback', False)),
+            r['participants_str'],
+        )
+        for r in itertools.chain((first,), rows)
+    )
+    tw.flush()
+    tw.detach()  # keep buf open once the wrapper is collected
+    buf.seek(0)
+    return buf
+
+
 async def export_cmd(update, context):
     msg = update.message
     chat_id = msg.chat.id
-    total = db_count_expenses(chat_id)
-    if total == 0:
-        await msg.reply_text(T["no_expenses"] if HE_IL else "No expenses yet.", disable_notification=True)
+    data = await load_chat_async(chat_id)
+    buf = await asyncio.to_thread(_export_csv, chat_id, data.get('currency', DEFAULT_CURRENCY))
+    if buf is None:
+        await _reply(msg, data, "no_expenses")
         return
-    rows = db_export_expenses(chat_id)
-    # Build CSV in-memory
-    import io, csv, datetime
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id","payer","amount","currency","description","category","timestamp_iso","original_amount","original_currency","fx_rate","fx_fallback","participants"])
-    # Need user names for payer mapping
-    data = load_chat(chat_id)
-    users = data['users']
-    currency = data.get('currency', DEFAULT_CURRENCY)
-    for r in rows:
-        ts_iso = datetime.datetime.utcfromtimestamp(r['ts']).isoformat()
-        participants = ";".join(str(p) for p in r['participants'])
-        writer.writerow([
-            r['id'], r['payer'], f"{r['amount']:.2f}", currency, r['description'], r['category'], ts_iso,
-            ("" if r['original_amount'] is None else f"{r['original_amount']:.2f}"), r['original_currency'] or "", ("" if r['fx_rate'] is None else f"{r['fx_rate']:.6f}"), int(r.get('fx_fallback', False)), participants
-        ])
-    output.seek(0)
-    csv_bytes = output.getvalue().encode('utf-8')
-    from telegram import InputFile
     filename = f"expenses_{chat_id}.csv"
-    await msg.reply_document(document=InputFile(csv_bytes, filename=filename), filename=filename, disable_notification=True)
+    await msg.reply_document(document=InputFile(buf, filename=filename), filename=filename, disable_notification=True)
 
 
 async def reset_chat(update, context):
@@ -1256,16 +1803,16 @@ async def reset_chat(update, context):
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("✅ כן", callback_data="RESET:CONFIRM"), InlineKeyboardButton("❌ לא", callback_data="RESET:CANCEL")]
     ])
-    await msg.reply_text(T["reset_inline_warn"] if HE_IL else "Warning: This will erase all data. Continue?", reply_markup=keyboard, disable_notification=True)
+    await msg.reply_text(MSG[(await load_chat_async(chat_id))["_he"]]["reset_inline_warn"], reply_markup=keyboard, disable_notification=True)
+
+
+_PLACEHOLDER_TOKENS = frozenset({"REPLACE_WITH_YOUR_TOKEN", "CHANGE_ME", ""})
+_TOKEN_RE = re.compile(r"\d+:")
 
 
 def _valid_token(token: str) -> bool:
     # Telegram bot tokens are of the form <digits>:<alphanumeric>
-    if not token:
-        return False
-    if token in {"REPLACE_WITH_YOUR_TOKEN", "CHANGE_ME", ""}:
-        return False
-    return ":" in token and token.split(":", 1)[0].isdigit()
+    return bool(token) and token not in _PLACEHOLDER_TOKENS and _TOKEN_RE.match(token) is not None
 
 
 def main():
@@ -1274,6 +1821,9 @@ def main():
             "Invalid or missing TELEGRAM_BOT_TOKEN. Set it via environment variable. Example (PowerShell): \n"
             + "$env:TELEGRAM_BOT_TOKEN = '123456789:ABCDEF...'; docker compose up --build"
         )
+    if uvloop is not None:
+        # libuv-backed event loop; run_polling creates its loop through this policy
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     # Initialize database
     init_db(DEFAULT_CURRENCY)
     # Log AI provider selection
@@ -1285,7 +1835,21 @@ def main():
     else:
         log_ai.info("AI disabled (provider not configured)")
     logging.info("[SplitBot] Starting polling bot (log level=%s)...", LOG_LEVEL)
-    app = Application.builder().token(BOT_TOKEN).build()
+    async def _post_init(application: Application):
+        application.create_task(_flush_loop())
+        application.create_task(asyncio.to_thread(prefetch_fx, DEFAULT_CURRENCY, INLINE_CURRENCIES))
+        if AI_PROVIDER_ACTIVE == "OLLAMA":
+            application.create_task(_ollama_health_loop())
+
+    async def _post_shutdown(application: Application):
+        flush_dirty_chats()
+
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(True).post_init(_post_init).post_shutdown(_post_shutdown)
+    if AIORateLimiter is not None:
+        # Every outgoing Bot API call is throttled to Telegram's limits (30/s overall, 20/min per group)
+        # and retried once on RetryAfter, instead of concurrent handlers tripping flood control.
+        builder = builder.rate_limiter(AIORateLimiter(max_retries=1))
+    app = builder.build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("setcurrency", set_currency))
@@ -1310,133 +1874,173 @@ def main():
         await query.answer()
         code = query.data.split(":", 1)[1]
         chat_id = query.message.chat.id
-        data = load_chat(chat_id)
-        if data["expenses"] and code != data["currency"]:
-            if HE_IL:
-                await query.edit_message_text(T["currency_locked"].format(cur=data['currency']))
-            else:
-                await query.edit_message_text(f"Cannot change currency after expenses exist (still {data['currency']}).")
+        async with chat_lock(chat_id):
+            data = await load_chat_async(chat_id)
+            old = data["currency"]
+            locked = code != old and await asyncio.to_thread(db_count_expenses, chat_id)
+            if not locked:
+                data["currency"] = code
+                save_chat(data)
+        if locked:
+            await query.edit_message_text(MSG[data["_he"]]["currency_locked"].format(cur=old))
             return
-        old = data["currency"]
-        data["currency"] = code
-        save_chat(data)
-        if HE_IL:
-            await query.edit_message_text(T["currency_changed"].format(old=old, new=code))
-        else:
-            await query.edit_message_text(f"Default currency changed: {old} -> {code}.")
+        context.application.create_task(asyncio.to_thread(prefetch_fx, code, INLINE_CURRENCIES))
+        await query.edit_message_text(MSG[data["_he"]]["currency_changed"].format(old=old, new=code))
 
     async def ai_expense_callback(update: Update, context):
         query = update.callback_query
         if not query or not query.data or not query.data.startswith("AIEXP:"):
             return
-        await query.answer()
-        action = query.data.split(":", 1)[1]
-        chat_id = query.message.chat.id
-        pending = PENDING_EXPENSES.get(chat_id)
-        if action == "ACCEPT":
-            if not pending:
-                await query.edit_message_text(T["pending_missing"] if HE_IL else "No pending expense.")
-                return
-            # Insert into DB
-            # participants expected as list[int] for equal split
-            participants = list(pending["participants"])
-            exp_id = insert_expense(
-                chat_id=chat_id,
-                payer_id=pending["payer"],
-                amount=pending["amount"],
-                description=pending["description"],
-                category=pending.get("category", "other"),
-                original_amount=pending.get("original_amount"),
-                original_currency=pending.get("original_currency"),
-                fx_rate=pending.get("fx_rate"),
-                fx_fallback=pending.get("fx_fallback", False),
-                participants=participants,
-                ts=int(pending.get("ts", time.time())),
-            )
-            PENDING_EXPENSES.pop(chat_id, None)
-            currency = get_currency(chat_id, DEFAULT_CURRENCY) or DEFAULT_CURRENCY
-            rate = pending.get("fx_rate")
-            if pending.get("original_currency") and pending.get("original_currency") != currency and rate:
-                text = T["auto_added_conv"].format(id=exp_id, amt=pending['amount'], cur=currency,
-                                                    oamt=pending['original_amount'], ocur=pending['original_currency'], rate=rate,
-                                                    cat=pending['category'], desc=pending['description'])
-            else:
-                text = T["auto_added"].format(id=exp_id, amt=pending['amount'], cur=currency,
-                                               cat=pending['category'], desc=pending['description'])
-            text = f"{CATEGORY_EMOJI.get(pending['category'],'')} " + text
-            if HE_IL:
-                text += "\n" + T["pending_saved"].format(id=exp_id)
-            else:
-                text += f"\nSaved expense #{exp_id}"
-            await query.edit_message_text(text)
-        elif action == "CANCEL":
-            if pending:
+        # Answer the query concurrently with the DB work below instead of before it
+        answered = asyncio.create_task(query.answer())
+        try:
+            action = query.data.split(":", 1)[1]
+            chat_id = query.message.chat.id
+            data = await load_chat_async(chat_id)
+            m = MSG[data["_he"]]
+            if action == "ACCEPT":
+                # Claim the preview before any await so a double-tapped Approve can't insert it twice
+                pending = PENDING_EXPENSES.pop(chat_id, None)
+                if not pending:
+                    await query.edit_message_text(m["pending_missing"])
+                    return
+                # Insert into DB
+                # participants expected as list[int] for equal split
+                participants = list(pending["participants"])
+                amt, desc = pending["amount"], pending["description"]
+                cat = pending.get("category", "other")
+                oamt, ocur = pending.get("original_amount"), pending.get("original_currency")
+                rate, fb = pending.get("fx_rate"), pending.get("fx_fallback", False)
+                try:
+                    exp_id = await asyncio.to_thread(
+                        insert_expense,
+                        chat_id=chat_id,
+                        payer_id=pending["payer"],
+                        amount=amt,
+                        description=desc,
+                        category=cat,
+                        original_amount=oamt,
+                        original_currency=ocur,
+                        fx_rate=rate,
+                        fx_fallback=fb,
+                        participants=participants,
+                        ts=int(pending.get("ts", time.time())),
+                    )
+                except Exception:
+                    # Put it back for a retry, unless a newer preview arrived meanwhile
+                    PENDING_EXPENSES.setdefault(chat_id, pending)
+                    raise
+                bump_revision(data)
+                currency = data["currency"]
+                tpl = m["auto_added_conv"] if ocur and ocur != currency and rate else m["auto_added"]
+                text = CATEGORY_PREFIX.get(cat, " ") + tpl.format(
+                    id=exp_id, amt=amt, approx="~" if fb else "", cur=currency,
+                    oamt=oamt, ocur=ocur, rate=rate, cat=cat, desc=desc,
+                )
+                text += "\n" + m["pending_saved"].format(id=exp_id)
+                await query.edit_message_text(text)
+            elif action == "CANCEL":
                 PENDING_EXPENSES.pop(chat_id, None)
-            base = query.message.text.split("\n")
-            if HE_IL:
-                base.append(T["pending_canceled"])
+                await query.edit_message_text(f"{query.message.text}\n{m['pending_canceled']}")
             else:
-                base.append("Canceled.")
-            await query.edit_message_text("\n".join(base))
-        else:
-            await query.edit_message_text("Unknown action.")
+                await query.edit_message_text("Unknown action.")
+        finally:
+            await answered
 
     async def reset_callback(update: Update, context):
         query = update.callback_query
         if not query or not query.data or not query.data.startswith("RESET:"):
             return
-        await query.answer()
-        action = query.data.split(":", 1)[1]
-        chat_id = query.message.chat.id
-        if action == "CONFIRM":
-            fp = DATA_DIR / f"{chat_id}.json"
-            if fp.exists():
-                try:
-                    fp.unlink()
-                except Exception as e:  # pragma: no cover
-                    logging.warning("Failed to delete chat file %s: %s", fp, e)
-            data = load_chat(chat_id)
-            text = T["reset_inline_done"] if HE_IL else "Reset complete. Use /adduser to add participants."
-            await query.edit_message_text(text)
-        elif action == "CANCEL":
-            await query.edit_message_text(T["reset_inline_canceled"] if HE_IL else "Reset canceled.")
-        else:
-            await query.edit_message_text("Unknown reset action")
+        # Answer the query concurrently with the DB work below instead of before it
+        answered = asyncio.create_task(query.answer())
+        try:
+            action = query.data.split(":", 1)[1]
+            chat_id = query.message.chat.id
+            m = MSG[(await load_chat_async(chat_id))["_he"]]  # before the reset drops the chat's language
+            if action == "CONFIRM":
+                await reset_chat_data(chat_id)
+                await query.edit_message_text(m["reset_inline_done"])
+            elif action == "CANCEL":
+                await query.edit_message_text(m["reset_inline_canceled"])
+            else:
+                await query.edit_message_text("Unknown reset action")
+        finally:
+            await answered
 
     async def list_pagination_callback(update: Update, context):
         query = update.callback_query
         if not query or not query.data or not query.data.startswith("LIST:"):
             return
-        await query.answer()
+        # Answer the query concurrently with the DB work below instead of before it
+        answered = asyncio.create_task(query.answer())
         try:
-            page = int(query.data.split(':',1)[1])
-        except ValueError:
+            parts = query.data.split(':')
+            try:
+                if len(parts) == 4:
+                    direction, page, cursor = parts[1], _page_number(parts[2]), int(parts[3])
+                else:
+                    # Legacy LIST:<page> buttons on older messages
+                    direction, page, cursor = None, _page_number(parts[1]), None
+            except ValueError:
+                return
+            chat_id = query.message.chat.id
+            if chat_id in _PAGE_BUSY:
+                return
+            _PAGE_BUSY.add(chat_id)
+            try:
+                data = await load_chat_async(chat_id)
+                cache_key = (chat_id, data["_rev"], query.data)
+                rendered = _PAGE_CACHE.get(cache_key)
+                if rendered is None:
+                    users = data['users']
+                    currency = data.get('currency', DEFAULT_CURRENCY)
+                    if direction == "N":
+                        expenses, total = await asyncio.to_thread(db_list_expenses_page, chat_id, PAGE_SIZE, after_id=cursor)
+                    elif direction == "P":
+                        expenses, total = await asyncio.to_thread(db_list_expenses_page, chat_id, PAGE_SIZE, before_id=cursor)
+                    else:
+                        expenses, total = await asyncio.to_thread(db_list_expenses_page, chat_id, PAGE_SIZE, page*PAGE_SIZE)
+                    text = build_expense_page_text(expenses, users, currency, page, total, data["_he"])
+                    rendered = _PAGE_CACHE[cache_key] = (text, build_pagination_keyboard(page, total, expenses))
+                text, keyboard = rendered
+                try:
+                    await query.edit_message_text(text, reply_markup=keyboard)
+                except Exception as e:
+                    log.warning("pagination edit failed: %s", e)
+            finally:
+                _PAGE_BUSY.discard(chat_id)
+        finally:
+            await answered
+
+    # One callback handler routes on the "<PREFIX>:" of the callback data
+    callback_routes = {
+        "CUR": currency_callback,
+        "AIEXP": ai_expense_callback,
+        "RESET": reset_callback,
+        "LIST": list_pagination_callback,
+    }
+
+    async def callback_dispatch(update: Update, context):
+        data = update.callback_query.data
+        if not isinstance(data, str):
             return
-        chat_id = query.message.chat.id
-        data = load_chat(chat_id)
-        users = data['users']
-        currency = data.get('currency', DEFAULT_CURRENCY)
-        total = db_count_expenses(chat_id)
-        expenses = db_list_expenses(chat_id, PAGE_SIZE, page*PAGE_SIZE)
-        text = build_expense_page_text(expenses, users, currency, page, total)
-        keyboard = build_pagination_keyboard(page, total)
-        try:
-            await query.edit_message_text(text, reply_markup=keyboard)
-        except Exception as e:
-            log.warning("pagination edit failed: %s", e)
-
-    # Specific patterns to avoid overlap so AIEXP callbacks aren't swallowed by first handler
-    app.add_handler(CallbackQueryHandler(currency_callback, pattern=r"^CUR:"))
-    app.add_handler(CallbackQueryHandler(ai_expense_callback, pattern=r"^AIEXP:"))
-    app.add_handler(CallbackQueryHandler(reset_callback, pattern=r"^RESET:"))
-    app.add_handler(CallbackQueryHandler(list_pagination_callback, pattern=r"^LIST:"))
+        handler = callback_routes.get(data.partition(":")[0])
+        if handler is not None:
+            await handler(update, context)
+
+    app.add_handler(CallbackQueryHandler(callback_dispatch))
     # Free text handler last
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, free_text_handler))
     app.add_handler(CommandHandler("list", list_expenses))
     app.add_handler(CommandHandler("bal", show_balances))
     app.add_handler(CommandHandler("settle", settle))
     try:
-        app.run_polling(drop_pending_updates=True)
+        # Long-poll at Telegram's maximum wait so an idle bot makes one getUpdates call per ~50 s
+        app.run_polling(
+            drop_pending_updates=True,
+            timeout=50,
+            allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY],
+        )
     except Exception as e:
         logging.exception("[SplitBot] Fatal error running bot: %s", e)
         raise SystemExit(1)
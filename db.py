@@ -1,8 +1,15 @@
+import heapq
+import logging
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 import time
 
+log = logging.getLogger("splitbot.db")
+
 DB_PATH = Path('data') / 'splitbot.db'
 
 SCHEMA = [
@@ -11,7 +18,9 @@ SCHEMA = [
         chat_id INTEGER PRIMARY KEY,
         currency TEXT NOT NULL,
         virtual_seq INTEGER NOT NULL DEFAULT -1,
-        created_at INTEGER NOT NULL
+        created_at INTEGER NOT NULL,
+        language TEXT NOT NULL DEFAULT 'he',
+        expense_count INTEGER NOT NULL DEFAULT 0
     )
     """,
     """
@@ -45,21 +54,107 @@ SCHEMA = [
         user_id INTEGER NOT NULL,
         weight REAL NOT NULL DEFAULT 1.0,
         PRIMARY KEY (expense_id, user_id)
-    )
+    ) WITHOUT ROWID
     """,
     """
     CREATE INDEX IF NOT EXISTS idx_expenses_chat_ts ON expenses(chat_id, ts DESC)
     """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_expenses_chat_id ON expenses(chat_id, id DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_name_nocase ON users(chat_id, name COLLATE NOCASE)
+    """,
+    # Running per-category sums for /stats, maintained by CAT_TOTALS_TRIGGERS; n drops the row at zero expenses
+    """
+    CREATE TABLE IF NOT EXISTS cat_totals (
+        chat_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, category)
+    ) WITHOUT ROWID
+    """,
 ]
 
+# Keep chats.expense_count in step with the expenses table (created after the column migration)
+COUNT_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_ai AFTER INSERT ON expenses BEGIN
+        UPDATE chats SET expense_count=expense_count+1 WHERE chat_id=NEW.chat_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_ad AFTER DELETE ON expenses BEGIN
+        UPDATE chats SET expense_count=expense_count-1 WHERE chat_id=OLD.chat_id;
+    END
+    """,
+]
+
+CAT_TOTALS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_cat_totals_ai AFTER INSERT ON expenses BEGIN
+        INSERT INTO cat_totals(chat_id, category, total, n) VALUES (NEW.chat_id, NEW.category, NEW.amount, 1)
+        ON CONFLICT(chat_id, category) DO UPDATE SET total=total+excluded.total, n=n+1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_cat_totals_ad AFTER DELETE ON expenses BEGIN
+        UPDATE cat_totals SET total=total-OLD.amount, n=n-1 WHERE chat_id=OLD.chat_id AND category=OLD.category;
+        DELETE FROM cat_totals WHERE chat_id=OLD.chat_id AND category=OLD.category AND n<=0;
+    END
+    """,
+]
+
+
+# Per-connection settings; journal_mode=WAL is persistent and set once in init_db.
+# NORMAL sync is durable under WAL except for the last commits on power loss.
+CONN_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=134217728",
+)
+
+# One long-lived connection per thread (the event loop's to_thread workers are a small fixed pool),
+# so page cache and prepared statements survive between calls. Under WAL, readers on one
+# connection don't block the writer on another.
+_LOCAL = threading.local()
+
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is None:
+        # timeout doubles as the busy timeout: a writer waits up to 5s for the WAL write lock instead of raising SQLITE_BUSY
+        conn = sqlite3.connect(DB_PATH, timeout=5.0, cached_statements=256)
+        for pragma in CONN_PRAGMAS:
+            conn.execute(pragma)
+        _LOCAL.conn = conn
+    return conn
+
+
+# SQLite allows one writer at a time. Queueing writers on this lock hands the write lock over as soon
+# as it is free (the busy handler polls with growing sleeps) and rules out the SQLITE_BUSY a deferred
+# read-then-write transaction gets when another thread commits in between. Readers never take it.
+_WRITE_LOCK = threading.Lock()
+
+
+@contextmanager
+def transaction():
+    """Yield a cursor for a write; everything executed on it is committed once (or rolled back) on exit."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        with _WRITE_LOCK, conn:
+            yield cur
+    finally:
+        cur.close()
 
 
 def init_db(default_currency: str = 'USD'):
     DB_PATH.parent.mkdir(exist_ok=True, parents=True)
     with get_conn() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
         cur = conn.cursor()
         for stmt in SCHEMA:
             cur.execute(stmt)
@@ -78,57 +173,141 @@ def init_db(default_currency: str = 'USD'):
                 cur.execute("ALTER TABLE expense_participants ADD COLUMN weight REAL NOT NULL DEFAULT 1.0")
         except Exception:
             pass
-        conn.commit()
+        # Rows live in the (expense_id, user_id) primary-key B-tree itself, so participant lookups
+        # read weight without a rowid hop; older databases are rebuilt once.
+        cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='expense_participants'")
+        if "WITHOUT ROWID" not in cur.fetchone()[0].upper():
+            conn.commit()
+            try:
+                cur.execute("BEGIN")
+                cur.execute(
+                    "CREATE TABLE expense_participants_new (expense_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+                    "weight REAL NOT NULL DEFAULT 1.0, PRIMARY KEY (expense_id, user_id)) WITHOUT ROWID"
+                )
+                cur.execute("INSERT INTO expense_participants_new(expense_id, user_id, weight) "
+                            "SELECT expense_id, user_id, weight FROM expense_participants")
+                cur.execute("DROP TABLE expense_participants")  # takes idx_ep_cover with it
+                cur.execute("ALTER TABLE expense_participants_new RENAME TO expense_participants")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                log.exception("expense_participants WITHOUT ROWID rebuild failed")
+                raise
+        try:
+            cur.execute("PRAGMA table_info(chats)")
+            cols = [r[1] for r in cur.fetchall()]
+            if 'language' not in cols:
+                cur.execute("ALTER TABLE chats ADD COLUMN language TEXT NOT NULL DEFAULT 'he'")
+            if 'expense_count' not in cols:
+                cur.execute("ALTER TABLE chats ADD COLUMN expense_count INTEGER NOT NULL DEFAULT 0")
+                cur.execute("UPDATE chats SET expense_count=(SELECT COUNT(1) FROM expenses WHERE expenses.chat_id=chats.chat_id)")
+        except Exception:
+            pass
+        for stmt in COUNT_TRIGGERS:
+            cur.execute(stmt)
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_cat_totals_ai'")
+        if cur.fetchone() is None:
+            # Totals were never maintained for this database: seed them from the expenses once
+            cur.execute("DELETE FROM cat_totals")
+            cur.execute("INSERT INTO cat_totals(chat_id, category, total, n) "
+                        "SELECT chat_id, category, SUM(amount), COUNT(1) FROM expenses GROUP BY chat_id, category")
+            for stmt in CAT_TOTALS_TRIGGERS:
+                cur.execute(stmt)
 
 
 def ensure_chat(chat_id: int, default_currency: str) -> None:
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM chats WHERE chat_id=?", (chat_id,))
-        if cur.fetchone() is None:
-            cur.execute(
-                "INSERT INTO chats(chat_id, currency, virtual_seq, created_at) VALUES (?,?,?,?)",
-                (chat_id, default_currency, -1, int(time.time()))
-            )
-            conn.commit()
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO chats(chat_id, currency, virtual_seq, created_at) VALUES (?,?,?,?) ON CONFLICT(chat_id) DO NOTHING",
+            (chat_id, default_currency, -1, int(time.time()))
+        )
 
 
 def get_chat(chat_id: int) -> Optional[Dict[str, Any]]:
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT chat_id, currency, virtual_seq FROM chats WHERE chat_id=?", (chat_id,))
+        cur.execute("SELECT chat_id, currency, virtual_seq, language FROM chats WHERE chat_id=?", (chat_id,))
         row = cur.fetchone()
         if not row:
             return None
-        return {"chat_id": row[0], "currency": row[1], "virtual_seq": row[2]}
+        return {"chat_id": row[0], "currency": row[1], "virtual_seq": row[2], "language": row[3]}
+
+
+def _chat_state(cur: sqlite3.Cursor, chat_id: int, default_currency: str) -> Dict[str, Any]:
+    cur.execute(
+        "INSERT OR IGNORE INTO chats(chat_id, currency, virtual_seq, created_at) VALUES (?,?,?,?)",
+        (chat_id, default_currency, -1, int(time.time()))
+    )
+    cur.execute("SELECT currency, virtual_seq, language FROM chats WHERE chat_id=?", (chat_id,))
+    currency, virtual_seq, language = cur.fetchone()
+    cur.execute("SELECT user_id, name FROM users WHERE chat_id=? ORDER BY rowid", (chat_id,))
+    users = {str(uid): name for uid, name in cur.fetchall()}
+    return {"chat_id": chat_id, "currency": currency, "language": language,
+            "virtual_seq": virtual_seq, "users": users}
+
+
+def load_chat_state(chat_id: int, default_currency: str) -> Dict[str, Any]:
+    """Chat settings plus participant names (str user id -> name), creating the chat row if needed."""
+    with transaction() as cur:
+        return _chat_state(cur, chat_id, default_currency)
+
+
+def save_chat_settings(rows: List[Tuple[int, str, str]]) -> None:
+    """Persist (chat_id, currency, language) for several chats in one transaction."""
+    with transaction() as cur:
+        cur.executemany("UPDATE chats SET currency=?, language=? WHERE chat_id=?",
+                        [(currency, language, chat_id) for chat_id, currency, language in rows])
+
+
+def import_chat_json(chat_id: int, data: Dict[str, Any], default_currency: str) -> None:
+    """One-time import of a legacy data/<chat_id>.json file (settings and participant names)."""
+    with transaction() as cur:
+        cur.execute(
+            "INSERT OR IGNORE INTO chats(chat_id, currency, virtual_seq, created_at) VALUES (?,?,?,?)",
+            (chat_id, default_currency, -1, int(time.time()))
+        )
+        cur.execute(
+            "UPDATE chats SET currency=?, language=?, virtual_seq=MIN(virtual_seq, ?) WHERE chat_id=?",
+            (data.get("currency") or default_currency, data.get("language") or "he",
+             int(data.get("virtual_seq", -1)), chat_id)
+        )
+        cur.executemany(
+            "INSERT OR IGNORE INTO users(chat_id, user_id, name, is_virtual) VALUES (?,?,?,?)",
+            [(chat_id, int(uid), name, int(int(uid) < 0)) for uid, name in (data.get("users") or {}).items()]
+        )
+
+
+def reset_chat(chat_id: int, default_currency: str) -> Dict[str, Any]:
+    """Delete a chat's expenses, participants and settings and return its fresh default state, atomically."""
+    with transaction() as cur:
+        cur.execute("DELETE FROM expense_participants WHERE expense_id IN (SELECT id FROM expenses WHERE chat_id=?)", (chat_id,))
+        cur.execute("DELETE FROM expenses WHERE chat_id=?", (chat_id,))
+        cur.execute("DELETE FROM users WHERE chat_id=?", (chat_id,))
+        cur.execute("DELETE FROM chats WHERE chat_id=?", (chat_id,))
+        return _chat_state(cur, chat_id, default_currency)
 
 
 def set_chat_currency(chat_id: int, currency: str):
-    with get_conn() as conn:
-        conn.execute("UPDATE chats SET currency=? WHERE chat_id=?", (currency, chat_id))
-        conn.commit()
+    with transaction() as cur:
+        cur.execute("UPDATE chats SET currency=? WHERE chat_id=?", (currency, chat_id))
 
 
 def get_currency(chat_id: int, default_currency: str) -> str:
-    chat = get_chat(chat_id)
-    if chat:
-        return chat['currency']
+    row = get_conn().execute("SELECT currency FROM chats WHERE chat_id=?", (chat_id,)).fetchone()
+    if row:
+        return row[0]
     ensure_chat(chat_id, default_currency)
     return default_currency
 
 
 def ensure_user(chat_id: int, user_id: int, name: str) -> None:
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM users WHERE chat_id=? AND user_id=?", (chat_id, user_id))
-        row = cur.fetchone()
-        if row is None:
-            cur.execute("INSERT INTO users(chat_id, user_id, name, is_virtual) VALUES (?,?,?,0)", (chat_id, user_id, name))
-        else:
-            # Optionally update name if changed
-            if row[0] != name:
-                cur.execute("UPDATE users SET name=? WHERE chat_id=? AND user_id=?", (name, chat_id, user_id))
-        conn.commit()
+    # One upsert; the row is only rewritten when the name actually changed
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO users(chat_id, user_id, name, is_virtual) VALUES (?,?,?,0) "
+            "ON CONFLICT(chat_id, user_id) DO UPDATE SET name=excluded.name WHERE users.name<>excluded.name",
+            (chat_id, user_id, name)
+        )
 
 
 def list_users(chat_id: int) -> Dict[int, str]:
@@ -139,33 +318,35 @@ def list_users(chat_id: int) -> Dict[int, str]:
 
 
 def add_virtual_user(chat_id: int, name: str) -> Optional[int]:
-    if not name.strip():
+    name = name.strip()
+    if not name:
         return None
-    with get_conn() as conn:
-        cur = conn.cursor()
-        # Check duplicate
-        cur.execute("SELECT 1 FROM users WHERE chat_id=? AND lower(name)=lower(?)", (chat_id, name.strip()))
-        if cur.fetchone() is not None:
-            return None
-        # Get current seq
-        cur.execute("SELECT virtual_seq FROM chats WHERE chat_id=?", (chat_id,))
+    with transaction() as cur:
+        # Duplicate check and id allocation in one statement; no row comes back for a taken name or unknown chat
+        cur.execute(
+            "UPDATE chats SET virtual_seq=virtual_seq-1 WHERE chat_id=? "
+            "AND NOT EXISTS (SELECT 1 FROM users WHERE chat_id=? AND name=? COLLATE NOCASE) "
+            "RETURNING virtual_seq+1",
+            (chat_id, chat_id, name)
+        )
         row = cur.fetchone()
-        if not row:
+        if row is None:
             return None
-        seq = row[0]
-        new_id = seq
-        next_seq = seq - 1
-        cur.execute("UPDATE chats SET virtual_seq=? WHERE chat_id=?", (next_seq, chat_id))
-        cur.execute("INSERT INTO users(chat_id, user_id, name, is_virtual) VALUES (?,?,?,1)", (chat_id, new_id, name.strip()))
-        conn.commit()
+        new_id = row[0]
+        cur.execute("INSERT INTO users(chat_id, user_id, name, is_virtual) VALUES (?,?,?,1)", (chat_id, new_id, name))
         return new_id
 
 
+@lru_cache(maxsize=64)
+def _weights_sql(n: int) -> str:
+    # One SQL string per participant count, so each arity is prepared once and then hits the statement cache
+    return f"SELECT user_id, weight FROM users WHERE chat_id=? AND user_id IN ({','.join('?' * n)})"
+
+
 def insert_expense(chat_id: int, payer_id: int, amount: float, description: str, category: str, ts: int,
                    participants: List[int], original_amount: Optional[float], original_currency: Optional[str],
                    fx_rate: Optional[float], fx_fallback: bool) -> int:
-    with get_conn() as conn:
-        cur = conn.cursor()
+    with transaction() as cur:
         cur.execute(
             "INSERT INTO expenses(chat_id, payer_id, amount, description, category, ts, original_amount, original_currency, fx_rate, fx_fallback) "
             "VALUES (?,?,?,?,?,?,?,?,?,?)",
@@ -174,8 +355,7 @@ def insert_expense(chat_id: int, payer_id: int, amount: float, description: str,
         exp_id = cur.lastrowid
         # Fetch current user weights
         if participants:
-            qmarks = ",".join(["?"] * len(participants))
-            cur.execute(f"SELECT user_id, weight FROM users WHERE chat_id=? AND user_id IN ({qmarks})", (chat_id, *participants))
+            cur.execute(_weights_sql(len(participants)), (chat_id, *participants))
             weights_map = {row[0]: row[1] for row in cur.fetchall()}
         else:
             weights_map = {}
@@ -183,119 +363,147 @@ def insert_expense(chat_id: int, payer_id: int, amount: float, description: str,
             "INSERT OR IGNORE INTO expense_participants(expense_id, user_id, weight) VALUES (?,?,?)",
             [(exp_id, uid, float(weights_map.get(uid, 1.0))) for uid in participants]
         )
-        conn.commit()
-        return exp_id
+    return exp_id
 
 
-def get_next_expense_id(chat_id: int) -> int:
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT COALESCE(MAX(id),0)+1 FROM expenses WHERE chat_id=?", (chat_id,))
-        row = cur.fetchone()
-        return row[0] if row else 1
+EXPENSE_COLUMNS = "id, payer_id, amount, description, category, ts, original_amount, original_currency, fx_rate, fx_fallback"
+
+
+def _expense_from_row(r) -> Dict[str, Any]:
+    return {
+        'id': r[0], 'payer': r[1], 'amount': r[2], 'description': r[3], 'category': r[4], 'ts': r[5],
+        'original_amount': r[6], 'original_currency': r[7], 'fx_rate': r[8], 'fx_fallback': bool(r[9])
+    }
 
 
 def list_expenses(chat_id: int, limit: int, offset: int) -> List[Dict[str, Any]]:
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute(
-            "SELECT id, payer_id, amount, description, category, ts, original_amount, original_currency, fx_rate, fx_fallback "
-            "FROM expenses WHERE chat_id=? ORDER BY id DESC LIMIT ? OFFSET ?",
+            f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE chat_id=? ORDER BY id DESC LIMIT ? OFFSET ?",
             (chat_id, limit, offset)
         )
+        return [_expense_from_row(r) for r in cur.fetchall()]
+
+
+# Fixed SQL text per paging mode so the connection's statement cache always hits
+_PAGE_SQL = {
+    mode: f"SELECT {EXPENSE_COLUMNS}, (SELECT expense_count FROM chats WHERE chat_id=?) "
+          f"FROM expenses WHERE chat_id=? {where} ORDER BY id {tail}"
+    for mode, where, tail in (
+        ("offset", "", "DESC LIMIT ? OFFSET ?"),
+        ("after", "AND id<?", "DESC LIMIT ?"),
+        ("before", "AND id>?", "ASC LIMIT ?"),
+    )
+}
+
+
+def list_expenses_page(chat_id: int, limit: int, offset: int = 0, after_id: Optional[int] = None,
+                       before_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """One page of expenses (id DESC) plus the chat's total expense count from the same statement.
+
+    after_id / before_id select a keyset page (older than / newer than the given id) instead of offset.
+    """
+    if after_id is not None:
+        mode, params = "after", (after_id, limit)
+    elif before_id is not None:
+        mode, params = "before", (before_id, limit)
+    else:
+        mode, params = "offset", (limit, offset)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_PAGE_SQL[mode], (chat_id, chat_id, *params))
         rows = cur.fetchall()
-        result = []
-        for r in rows:
-            result.append({
-                'id': r[0], 'payer': r[1], 'amount': r[2], 'description': r[3], 'category': r[4], 'ts': r[5],
-                'original_amount': r[6], 'original_currency': r[7], 'fx_rate': r[8], 'fx_fallback': bool(r[9])
-            })
-        return result
+        if not rows:
+            # Empty page: the count column never materialized, ask for it directly
+            cur.execute("SELECT expense_count FROM chats WHERE chat_id=?", (chat_id,))
+            row = cur.fetchone()
+            return [], row[0] if row else 0
+        if mode == "before":
+            rows.reverse()
+        return [_expense_from_row(r) for r in rows], rows[0][-1]
 
 
 def count_expenses(chat_id: int) -> int:
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT COUNT(1) FROM expenses WHERE chat_id=?", (chat_id,))
+        # Trigger-maintained, so this is a single-row lookup rather than an index range count
+        cur.execute("SELECT expense_count FROM chats WHERE chat_id=?", (chat_id,))
         row = cur.fetchone()
         return row[0] if row else 0
 
 
+_BALANCES_SQL = """
+WITH tw AS (
+    SELECT e.id, e.payer_id, e.amount, SUM(COALESCE(NULLIF(p.weight, 0), 1.0)) AS total
+    FROM expenses e JOIN expense_participants p ON p.expense_id = e.id
+    WHERE e.chat_id = ?
+    GROUP BY e.id
+)
+SELECT user_id, SUM(delta) FROM (
+    SELECT payer_id AS user_id, amount AS delta
+    FROM tw
+    WHERE total > 0
+    UNION ALL
+    SELECT p.user_id, -tw.amount * COALESCE(NULLIF(p.weight, 0), 1.0) / tw.total
+    FROM tw JOIN expense_participants p ON p.expense_id = tw.id
+    WHERE tw.total > 0
+)
+GROUP BY user_id
+ORDER BY user_id
+"""
+
+
 def compute_balances(chat_id: int) -> Dict[int, float]:
     # Weighted approach: each participant has a weight snapshot per expense.
+    # Aggregated in SQL; the returned dict is ordered by user_id.
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT id, payer_id, amount FROM expenses WHERE chat_id=?", (chat_id,))
-        expenses = cur.fetchall()
-        if not expenses:
-            return {}
-        cur2 = conn.cursor()
-        balances: Dict[int, float] = {}
-        for exp_id, payer_id, amount in expenses:
-            cur2.execute("SELECT user_id, weight FROM expense_participants WHERE expense_id=?", (exp_id,))
-            rows = cur2.fetchall()
-            if not rows:
-                continue
-            total_weight = sum(r[1] or 1.0 for r in rows)
-            if total_weight <= 0:
-                continue
-            # Payer initially pays full amount, owes their proportional share
-            balances[payer_id] = balances.get(payer_id, 0.0) + amount
-            for uid, w in rows:
-                share = amount * (float(w or 1.0) / total_weight)
-                balances[uid] = balances.get(uid, 0.0) - share
-        for k in list(balances.keys()):
-            balances[k] = round(balances[k], 2)
-        return balances
+        cur.execute(_BALANCES_SQL, (chat_id,))
+        return {uid: round(total, 2) for uid, total in cur.fetchall()}
 
 
 def list_settlements(balances: Dict[int, float]) -> List[Dict[str, Any]]:
-    creditors = []
-    debtors = []
-    for uid, amt in balances.items():
-        if amt > 0.01:
-            creditors.append([uid, amt])
-        elif amt < -0.01:
-            debtors.append([uid, amt])
-    creditors.sort(key=lambda x: x[1], reverse=True)
-    debtors.sort(key=lambda x: x[1])
+    # Largest creditor pays off against largest debtor; residuals go back on the heap.
+    # Works in integer cents so the matching never accumulates float error.
+    cents = {uid: round(amt * 100) for uid, amt in balances.items()}
+    creditors = [(-c, uid) for uid, c in cents.items() if c > 1]
+    debtors = [(c, uid) for uid, c in cents.items() if c < -1]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
     settlements = []
-    ci = 0; di = 0
-    while ci < len(creditors) and di < len(debtors):
-        c_uid, c_amt = creditors[ci]
-        d_uid, d_amt = debtors[di]
-        pay = min(c_amt, -d_amt)
-        settlements.append({'from': d_uid, 'to': c_uid, 'amount': round(pay,2)})
-        c_amt -= pay; d_amt += pay
-        creditors[ci][1] = c_amt; debtors[di][1] = d_amt
-        if c_amt <= 0.01: ci += 1
-        if d_amt >= -0.01: di += 1
+    while creditors and debtors:
+        c_neg, c_uid = heapq.heappop(creditors)
+        d_amt, d_uid = heapq.heappop(debtors)
+        pay = min(-c_neg, -d_amt)
+        settlements.append({'from': d_uid, 'to': c_uid, 'amount': pay / 100})
+        c_neg += pay; d_amt += pay
+        if c_neg < -1: heapq.heappush(creditors, (c_neg, c_uid))
+        if d_amt < -1: heapq.heappush(debtors, (d_amt, d_uid))
     return settlements
 
+
 def category_totals(chat_id: int) -> List[Tuple[str, float]]:
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT category, SUM(amount) FROM expenses WHERE chat_id=? GROUP BY category ORDER BY SUM(amount) DESC", (chat_id,))
+        cur.execute("SELECT category, total FROM cat_totals WHERE chat_id=? ORDER BY total DESC", (chat_id,))
         return [(row[0], row[1]) for row in cur.fetchall()]
 
 
-def export_expenses(chat_id: int) -> List[Dict[str, Any]]:
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT e.id, e.payer_id, e.amount, e.description, e.category, e.ts, e.original_amount, e.original_currency, e.fx_rate, e.fx_fallback "
-            "FROM expenses e WHERE e.chat_id=? ORDER BY e.id",
-            (chat_id,)
-        )
-        rows = cur.fetchall()
-        result = []
-        pcur = conn.cursor()
-        for r in rows:
-            pcur.execute("SELECT user_id FROM expense_participants WHERE expense_id=? ORDER BY user_id", (r[0],))
-            participants = [pr[0] for pr in pcur.fetchall()]
-            result.append({
-                'id': r[0], 'payer': r[1], 'amount': r[2], 'description': r[3], 'category': r[4], 'ts': r[5],
-                'original_amount': r[6], 'original_currency': r[7], 'fx_rate': r[8], 'fx_fallback': bool(r[9]),
-                'participants': participants,
-            })
-        return result
+def export_expenses(chat_id: int) -> Iterator[Dict[str, Any]]:
+    """Yield the chat's expenses one at a time, straight off the cursor (memory stays flat for big chats).
+
+    Participants come back pre-joined ("1;2;3") so the export loop just writes the column.
+    """
+    cur = get_conn().execute(
+        "SELECT e.id, e.payer_id, e.amount, e.description, e.category, e.ts, e.original_amount, e.original_currency, e.fx_rate, e.fx_fallback, "
+        "(SELECT GROUP_CONCAT(user_id, ';') FROM (SELECT user_id FROM expense_participants WHERE expense_id=e.id ORDER BY user_id)) "
+        "FROM expenses e WHERE e.chat_id=? ORDER BY e.id",
+        (chat_id,)
+    )
+    for r in cur:
+        yield {
+            'id': r[0], 'payer': r[1], 'amount': r[2], 'description': r[3], 'category': r[4], 'ts': r[5],
+            'original_amount': r[6], 'original_currency': r[7], 'fx_rate': r[8], 'fx_fallback': bool(r[9]),
+            'participants_str': r[10] or "",
+        }